@@ -0,0 +1,214 @@
+#! /usr/bin/env python3
+
+import argparse
+import contextlib
+import functools
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import split
+from segtypes.common.codesubsegment import CommonSegCodeSubsegment
+from segtypes.common.data import CommonSegData
+from segtypes.n64 import ci4, ci8, i4, i8, ia4, ia8, ia16, rgba16, rgba32
+from util import synthetic
+from util.n64 import Yay0decompress
+
+parser = argparse.ArgumentParser(
+    description="Time splat on a synthetic rom and config of a given size"
+)
+parser.add_argument("--seed", type=int, default=0)
+parser.add_argument("--code-files", type=int, default=32)
+parser.add_argument("--funcs-per-file", type=int, default=10)
+parser.add_argument("--overlays", type=int, default=4)
+parser.add_argument("--yay0-blobs", type=int, default=4)
+parser.add_argument("--yay0-size", type=lambda x: int(x, 0), default=0x8000)
+# Enough textures for one of every format that parse_image gets timed for
+parser.add_argument("--textures", type=int, default=len(synthetic.TEXTURE_FORMATS))
+parser.add_argument("--texture-size", type=int, default=64)
+parser.add_argument("--repeat", type=int, default=3, help="number of runs to time")
+parser.add_argument("--output", help="path to write the results to as json")
+parser.add_argument(
+    "--compare", help="path to the json results of an earlier run to compare against"
+)
+
+# The parts of a split that get timed on their own, as (name, owner, attribute)
+INSTRUMENTED: List[Tuple[str, Any, str]] = [
+    ("process_insns", CommonSegCodeSubsegment, "process_insns"),
+    ("determine_symbols", CommonSegCodeSubsegment, "determine_symbols"),
+    ("disassemble_data", CommonSegData, "disassemble_data"),
+    ("Yay0decompress", Yay0decompress, "decompress_yay0"),
+] + [
+    ("parse_image", cls, "parse_image")
+    for cls in [
+        ci4.N64SegCi4,
+        ci8.N64SegCi8,
+        i4.N64SegI4,
+        i8.N64SegI8,
+        ia4.N64SegIa4,
+        ia8.N64SegIa8,
+        ia16.N64SegIa16,
+        rgba16.N64SegRgba16,
+        rgba32.N64SegRgba32,
+    ]
+]
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.realpath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def timed(func: Callable, name: str, timings: Dict[str, float]) -> Callable:
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings[name] += time.perf_counter() - start
+
+    return wrapper
+
+
+@contextlib.contextmanager
+def instrument(timings: Dict[str, float]):
+    originals = []
+
+    for name, owner, attr in INSTRUMENTED:
+        timings.setdefault(name, 0.0)
+
+        original = vars(owner)[attr]
+        originals.append((owner, attr, original))
+
+        if isinstance(original, staticmethod):
+            setattr(owner, attr, staticmethod(timed(original.__func__, name, timings)))
+        else:
+            setattr(owner, attr, timed(original, name, timings))
+
+    try:
+        yield
+    finally:
+        for owner, attr, original in originals:
+            setattr(owner, attr, original)
+
+
+def run_split(config_path: Path):
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        split.main([str(config_path)], None, None, "all", False, use_cache=False)
+
+
+def run(args, work_dir: Path) -> Dict[str, List[float]]:
+    results: Dict[str, List[float]] = {}
+
+    def generate(run_name: str) -> Path:
+        # Every run gets a fresh output dir, so no run sees the c files an earlier one wrote
+        return synthetic.generate(
+            work_dir / run_name,
+            args.seed,
+            args.code_files,
+            args.funcs_per_file,
+            args.overlays,
+            args.yay0_blobs,
+            args.yay0_size,
+            args.textures,
+            args.texture_size,
+        )
+
+    for i in range(args.repeat):
+        config_path = generate(f"split_{i}")
+        start = time.perf_counter()
+        run_split(config_path)
+        results.setdefault("split.main", []).append(time.perf_counter() - start)
+
+        # Instrumented separately so the wrappers don't count towards split.main
+        config_path = generate(f"parts_{i}")
+        timings: Dict[str, float] = {}
+        with instrument(timings):
+            run_split(config_path)
+        for name, total in timings.items():
+            results.setdefault(name, []).append(total)
+
+    return results
+
+
+def summarize(runs: List[float]) -> Dict[str, Any]:
+    return {"min": min(runs), "median": statistics.median(runs), "runs": runs}
+
+
+def print_table(results: Dict[str, Dict[str, Any]], baseline: Optional[Dict]):
+    header = f"{'benchmark':<20} {'min ms':>10} {'median ms':>10}"
+    if baseline:
+        header += f" {'base ms':>10} {'ratio':>7}"
+    print(header)
+
+    for name, result in results.items():
+        line = (
+            f"{name:<20} {result['min'] * 1000:>10.1f} {result['median'] * 1000:>10.1f}"
+        )
+
+        if baseline:
+            base = baseline["results"].get(name)
+            if base and base["min"] > 0:
+                line += (
+                    f" {base['min'] * 1000:>10.1f} {result['min'] / base['min']:>7.2f}"
+                )
+
+        print(line)
+
+
+def main(args):
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    with tempfile.TemporaryDirectory(prefix="splat_bench_") as work_dir:
+        runs = run(args, Path(work_dir))
+
+    report = {
+        "splat_version": split.VERSION,
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "yay0_c_library": Yay0decompress.setup_lib(),
+        "params": {
+            "seed": args.seed,
+            "code_files": args.code_files,
+            "funcs_per_file": args.funcs_per_file,
+            "overlays": args.overlays,
+            "yay0_blobs": args.yay0_blobs,
+            "yay0_size": args.yay0_size,
+            "textures": args.textures,
+            "texture_size": args.texture_size,
+        },
+        "repeat": args.repeat,
+        "results": {name: summarize(r) for name, r in runs.items()},
+    }
+
+    if baseline and baseline.get("params") != report["params"]:
+        print("warning: comparing against results with different params")
+
+    print_table(report["results"], baseline)
+
+    if args.output:
+        with open(args.output, "w", newline="\n") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    args = parser.parse_args()
+    main(args)
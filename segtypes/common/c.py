@@ -116,6 +116,16 @@ class CommonSegC(CommonSegCodeSubsegment):
 
             self.scan_code(rom_bytes)
 
+    def cache(self):
+        # The scan reads which functions the C file defines, so it's part of what gets cached
+        c_text = None
+        path = self.out_path()
+        if path and options.do_c_func_detection() and os.path.exists(path):
+            with open(path, "rb") as f:
+                c_text = f.read()
+
+        return (super().cache(), c_text)
+
     def split(self, rom_bytes: bytes):
         if not self.rom_start == self.rom_end:
 
@@ -133,10 +143,7 @@ class CommonSegC(CommonSegCodeSubsegment):
                     is_new_c_file = True
 
             for func_addr in self.funcs_text:
-                func_sym = self.parent.get_symbol(
-                    func_addr, type="func", local_only=True
-                )
-                assert func_sym is not None
+                func_sym = self.funcs[func_addr]
 
                 if func_sym.name in self.global_asm_funcs or is_new_c_file:
                     self.create_c_asm_file(
@@ -154,15 +161,9 @@ class CommonSegC(CommonSegCodeSubsegment):
 
     def mark_c_funcs_as_defined(self, c_funcs):
         for func_name in c_funcs:
-            found = False
-            for func_addr in self.seg_symbols:
-                for symbol in self.seg_symbols[func_addr]:
-                    if symbol.name == func_name:
-                        symbol.defined = True
-                        found = True
-                        break
-                if found:
-                    break
+            symbol = self.get_most_parent().get_symbol_by_name(func_name)
+            if symbol:
+                symbol.defined = True
 
     def create_c_asm_file(self, funcs_text, func_addr, out_dir, func_sym: Symbol):
         outpath = Path(os.path.join(out_dir, self.name, func_sym.name + ".s"))
@@ -219,7 +220,7 @@ class CommonSegC(CommonSegCodeSubsegment):
         c_lines = self.get_c_preamble()
 
         for func in funcs_text:
-            func_name = self.parent.get_symbol(func, type="func", local_only=True).name
+            func_name = self.funcs[func].name
 
             # Terrible hack to "auto-decompile" empty functions
             # TODO move disassembly into funcs_text or somewhere we can access it from here
@@ -1,4 +1,4 @@
-from typing import Dict, Tuple
+from typing import Dict, List, Tuple
 from segtypes.common.group import CommonSegGroup
 from util.symbols import Symbol
 
@@ -36,6 +36,8 @@ class CommonSegCode(CommonSegGroup):
         self.labels_to_add = set()
         self.jtbl_glabels_to_add = set()
         self.jtbl_jumps = {}
+        # The addresses in jtbl_jumps, kept sorted
+        self.jtbl_jump_addrs: List[int] = []
         self.jumptables: Dict[int, Tuple[int, int]] = {}
 
     @property
@@ -1,10 +1,10 @@
 from dataclasses import dataclass
-from typing import List, Optional
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Sequence
 import typing
 from util import options
 from segtypes.common.code import CommonSegCode
 from collections import OrderedDict
-import re
 
 from capstone import (
     Cs,
@@ -13,12 +13,13 @@ from capstone import (
     CS_MODE_BIG_ENDIAN,
     CS_MODE_MIPS32,
     CS_MODE_LITTLE_ENDIAN,
-    CsInsn,
 )
 from capstone.mips import *
 
 from segtypes.segment import Segment
+from util import mips
 from util.compiler import SN64
+from util.intervals import OverlapIndex
 from util.symbols import Instruction, Symbol
 from util import log
 
@@ -29,6 +30,21 @@ class CommonSegCodeSubsegment(Segment):
     float_mnemonics = ["lwc1", "swc1"]
     short_mnemonics = ["addiu", "lh", "sh", "lhu"]
     byte_mnemonics = ["lb", "sb", "lbu"]
+    lo_mnemonics = [
+        "addiu",
+        "lw",
+        "sw",
+        "lh",
+        "sh",
+        "lhu",
+        "lb",
+        "sb",
+        "lbu",
+        "lwc1",
+        "swc1",
+        "ldc1",
+        "sdc1",
+    ]
     reg_numbers = {
         "$zero": "$0",
         "$at": "$1",
@@ -81,7 +97,7 @@ class CommonSegCodeSubsegment(Segment):
         return ".text"
 
     @staticmethod
-    def is_nops(insns: List[CsInsn]) -> bool:
+    def is_nops(insns: List[Instruction]) -> bool:
         for insn in insns:
             if insn.mnemonic != "nop":
                 return False
@@ -102,31 +118,54 @@ class CommonSegCodeSubsegment(Segment):
         return op_str
 
     def scan_code(self, rom_bytes, is_asm=False):
-        insns: List[CsInsn] = [
-            insn
-            for insn in CommonSegCodeSubsegment.md.disasm(
-                rom_bytes[self.rom_start : self.rom_end], self.vram_start
+        # capstone wants a bytes object, so this is the one place code gets copied out of the rom
+        code = bytes(rom_bytes[self.rom_start : self.rom_end])
+        endianness = options.get_endianess()
+
+        # disasm_lite yields plain tuples rather than a CsInsn per word, so the only thing allocated per
+        # instruction is the Instruction that's kept
+        insns: List[Instruction] = []
+        for address, size, mnemonic, op_str in CommonSegCodeSubsegment.md.disasm_lite(
+            code, self.vram_start
+        ):
+            offset = address - self.vram_start
+            insns.append(
+                Instruction(
+                    int.from_bytes(code[offset : offset + size], endianness),
+                    address,
+                    mnemonic,
+                    op_str,
+                    mnemonic,
+                    op_str,
+                    self.rom_start + offset,
+                )
             )
-        ]
+
+        branch_indices: Optional[List[int]] = None
+        hi_addrs: Optional[List[int]] = None
+        candidates = mips.find_candidates(code, endianness)
+        if candidates is not None:
+            branch_indices, hi_indices = candidates
+            hi_addrs = [self.vram_start + k * 4 for k in hi_indices]
 
         self.funcs: typing.OrderedDict[int, Symbol] = self.process_insns(
-            insns, self.rom_start, is_asm=is_asm
+            insns, is_asm=is_asm, branch_indices=branch_indices
         )
 
-        # TODO: set these in creation
         for func in self.funcs.values():
-            func.define = True
-            func.local_only = True
             func.size = len(func.insns) * 4
 
-        self.determine_symbols()
+        self.determine_symbols(hi_addrs)
 
     def split_code(self, rom_bytes):
         self.gather_jumptable_labels(rom_bytes)
         return self.add_labels()
 
     def process_insns(
-        self, insns: List[CsInsn], rom_addr, is_asm=False
+        self,
+        insns: List[Instruction],
+        is_asm=False,
+        branch_indices: Optional[Sequence[int]] = None,
     ) -> typing.OrderedDict[int, Symbol]:
         assert isinstance(self.parent, CommonSegCode)
         self.parent: CommonSegCode = self.parent
@@ -137,15 +176,19 @@ class CommonSegCodeSubsegment(Segment):
         start_new_func = True
         labels = []
 
-        big_endian = options.get_endianess() == "big"
+        # Collect labels, only looking at the instructions that could be branches if those are known
+        if branch_indices is None:
+            branch_indices = range(len(insns))
 
-        # Collect labels
-        for insn in insns:
-            if self.is_branch_insn(insn.mnemonic):
-                op_str_split = insn.op_str.split(" ")
-                branch_target = op_str_split[-1]
-                branch_addr = int(branch_target, 0)
-                labels.append((insn.address, branch_addr))
+        for k in branch_indices:
+            insn = insns[k]
+            if self.is_branch_insn(insn.raw_mnemonic) and mips.is_branch(insn.word):
+                labels.append((insn.address, mips.get_target(insn.word, insn.address)))
+
+        # Each branch spans the addresses from the lower of its address and target up to the higher one
+        branch_spans = OverlapIndex(
+            ((min(label), max(label)) for label in labels), min_depth=1
+        )
 
         # Main loop
         for i, insn in enumerate(insns):
@@ -153,7 +196,7 @@ class CommonSegCodeSubsegment(Segment):
             op_str = insn.op_str
 
             # If this is non-zero, disasm size insns
-            hard_size = 0
+            hard_size: float = 0
 
             if start_new_func:
                 func: Symbol = self.parent.create_symbol(insn.address, type="func")
@@ -167,8 +210,7 @@ class CommonSegCodeSubsegment(Segment):
 
             if mnemonic == "move":
                 # Let's get the actual instruction out
-                idx = 3 if big_endian else 0
-                opcode = insn.bytes[idx] & 0b00111111
+                opcode = mips.get_funct(insn.word)
 
                 if options.get_compiler() == SN64:
                     op_str += ", $0"
@@ -182,17 +224,19 @@ class CommonSegCodeSubsegment(Segment):
                 elif opcode == 33:
                     mnemonic = "addu"
                 else:
-                    print("INVALID INSTRUCTION " + str(insn), opcode)
+                    print(
+                        f"INVALID INSTRUCTION 0x{insn.address:X}: {insn.raw_mnemonic} {insn.raw_op_str}",
+                        opcode,
+                    )
             elif mnemonic == "jal":
-                jal_addr = int(op_str, 0)
+                jal_addr = mips.get_target(insn.word, insn.address)
                 jump_func = self.parent.create_symbol(
                     jal_addr, type="func", reference=True
                 )
                 op_str = jump_func.name
-            elif self.is_branch_insn(insn.mnemonic):
+            elif self.is_branch_insn(insn.raw_mnemonic) and mips.is_branch(insn.word):
                 op_str_split = op_str.split(" ")
-                branch_target = op_str_split[-1]
-                branch_target_int = int(branch_target, 0)
+                branch_target_int = mips.get_target(insn.word, insn.address)
 
                 label_sym = self.parent.get_symbol(
                     branch_target_int, type="label", reference=True, local_only=True
@@ -202,12 +246,11 @@ class CommonSegCodeSubsegment(Segment):
                     label_name = label_sym.name
                 else:
                     self.parent.labels_to_add.add(branch_target_int)
-                    label_name = f".L{branch_target[2:].upper()}"
+                    label_name = f".L{branch_target_int:X}"
 
                 op_str = " ".join(op_str_split[:-1] + [label_name])
             elif mnemonic in ["mtc0", "mfc0", "mtc2", "mfc2"]:
-                idx = 2 if big_endian else 1
-                rd = (insn.bytes[idx] & 0xF8) >> 3
+                rd = mips.get_rd(insn.word)
                 op_str = op_str.split(" ")[0] + " $" + str(rd)
             elif (
                 mnemonic == "break"
@@ -234,23 +277,21 @@ class CommonSegCodeSubsegment(Segment):
                 if op_str.startswith("$0, "):
                     op_str = op_str[4:]
 
-            func.insns.append(Instruction(insn, mnemonic, op_str, rom_addr))
-            rom_addr += 4
+            insn.mnemonic = mnemonic
+            insn.op_str = op_str
+            func.insns.append(insn)
 
             size_remaining = hard_size - len(func.insns) if hard_size > 0 else 0
 
             if mnemonic == "jr":
                 # Record potential jtbl jumps
                 if op_str not in ["$ra", "$31"]:
+                    if insn.address not in self.parent.jtbl_jumps:
+                        insort(self.parent.jtbl_jump_addrs, insn.address)
                     self.parent.jtbl_jumps[insn.address] = op_str
 
-                keep_going = False
-                for label in labels:
-                    if (label[0] > insn.address and label[1] <= insn.address) or (
-                        label[0] <= insn.address and label[1] > insn.address
-                    ):
-                        keep_going = True
-                        break
+                # Keep going if any branch crosses the jr
+                keep_going = branch_spans.contains(insn.address)
                 if not keep_going and not size_remaining:
                     end_func = True
                     continue
@@ -275,7 +316,7 @@ class CommonSegCodeSubsegment(Segment):
                     ret[func.vram_start] = func
 
         # Add the last function (or append nops to the previous one)
-        if not self.is_nops([insn.instruction for insn in func.insns]):
+        if not self.is_nops(func.insns):
             ret[func.vram_start] = func
         else:
             next(reversed(ret.values())).insns.extend(func.insns)
@@ -301,47 +342,105 @@ class CommonSegCodeSubsegment(Segment):
         else:
             sym.access_mnemonic = mnemonic
 
-    # Determine symbols
-    def determine_symbols(self):
+    @staticmethod
+    def find_hi_lo_pairs(
+        insns: List[Instruction], positions: Sequence[int], max_distance: int
+    ) -> Dict[int, int]:
+        # Pairs each lui of 0x8000 or above with the first addiu, load or store based on its register within
+        # max_distance instructions, in one walk over the function. Returns the index of each lui's lo by the
+        # lui's index. A lui is dropped once its register is loaded by another lui or used by anything that
+        # can't be its lo. positions holds every such lui's index (and can hold others), and the walk skips
+        # ahead to the next one whenever no lui is waiting
+        pairs: Dict[int, int] = {}
+
+        # The index of the lui each register is waiting on, and the last index any of them could pair at
+        pending: Dict[int, int] = {}
+        horizon = -1
+
+        next_pos = 0
+        j = 0
+        while j < len(insns):
+            if j > horizon:
+                pending.clear()
+                while next_pos < len(positions) and positions[next_pos] < j:
+                    next_pos += 1
+                if next_pos == len(positions):
+                    break
+                j = max(j, positions[next_pos])
+
+            insn = insns[j]
+            word = insn.word
+
+            if insn.raw_mnemonic == "lui":
+                pending.pop(mips.get_rt(word), None)
+
+                # Assumes all luis are going to load from 0x80000000 or higher (maybe false)
+                if mips.get_imm(word) >= 0x8000:
+                    pending[mips.get_rt(word)] = j
+                    horizon = j + max_distance - 1
+            elif pending and (
+                insn.raw_mnemonic in ["addiu", "ori"] or insn.raw_op_str.endswith(")")
+            ):
+                hi = pending.pop(mips.get_rs(word), None)
+
+                if (
+                    hi is not None
+                    and j - hi < max_distance
+                    and insn.raw_mnemonic in CommonSegCodeSubsegment.lo_mnemonics
+                    # capstone writes a zero offset as just (reg), and those have never been paired
+                    and not (insn.raw_op_str.endswith(")") and mips.get_simm(word) == 0)
+                ):
+                    pairs[hi] = j
+
+            j += 1
+
+        return pairs
+
+    # Determine symbols. If hi_addrs is given, only the instructions at those addresses can start a %hi/%lo pair or
+    # be a %gp_rel access, and the rest are skipped
+    def determine_symbols(self, hi_addrs: Optional[List[int]] = None):
         hi_lo_max_distance = options.hi_lo_max_distance()
 
         for func_addr in self.funcs:
             func = self.funcs[func_addr]
-            func_end_addr = func.insns[-1].instruction.address + 4
+            func_end_addr = func.insns[-1].address + 4
 
-            possible_jtbl_jumps = [
-                (k, v)
-                for k, v in self.parent.jtbl_jumps.items()
-                if k >= func_addr and k < func_end_addr
-            ]
-            possible_jtbl_jumps.sort(key=lambda x: x[0])
+            # The possible jtbl jumps in this function are jtbl_addrs[jtbl_cursor:jtbl_end]
+            jtbl_jumps = self.parent.jtbl_jumps
+            jtbl_addrs = self.parent.jtbl_jump_addrs
+            jtbl_cursor = bisect_left(jtbl_addrs, func_addr)
+            jtbl_end = bisect_left(jtbl_addrs, func_end_addr)
 
-            for i in range(len(func.insns)):
-                hi_insn: CsInsn = func.insns[i].instruction
+            positions: Sequence[int]
+            if hi_addrs is None:
+                positions = range(len(func.insns))
+            else:
+                start = bisect_left(hi_addrs, func_addr)
+                end = bisect_left(hi_addrs, func_end_addr)
+                positions = [(addr - func_addr) // 4 for addr in hi_addrs[start:end]]
 
-                # Ensure the first item in the list is always ahead of where we're looking
+            pairs = self.find_hi_lo_pairs(func.insns, positions, hi_lo_max_distance)
+
+            sym: Optional[Symbol]
+            for i in positions:
+                hi_insn = func.insns[i]
+
+                # Ensure the cursor is always at or ahead of where we're looking
                 while (
-                    len(possible_jtbl_jumps) > 0
-                    and possible_jtbl_jumps[0][0] < hi_insn.address
+                    jtbl_cursor < jtbl_end and jtbl_addrs[jtbl_cursor] < hi_insn.address
                 ):
-                    del possible_jtbl_jumps[0]
+                    jtbl_cursor += 1
 
                 # Find gp relative reads and writes e.g  lw $a1, 0x670($gp)
-                if hi_insn.op_str.endswith("($gp)"):
+                if hi_insn.raw_op_str.endswith("($gp)"):
                     gp_base = options.get_gp()
                     if gp_base is None:
                         log.error(
                             "gp_value not set in yaml, can't calculate %gp_rel reloc value for "
-                            + hi_insn.op_str
+                            + hi_insn.raw_op_str
                         )
 
-                    op_split = hi_insn.op_str.split(", ")
-                    gp_offset = op_split[1][:-5]  # extract the 0x670 part
-                    if len(gp_offset) == 0:
-                        gp_offset = 0
-                    else:
-                        gp_offset = int(gp_offset, 16)
-                    symbol_addr = gp_base + gp_offset
+                    symbol_addr = gp_base + mips.get_simm(hi_insn.word)
 
                     sym = self.parent.create_symbol(
                         symbol_addr, offsets=True, reference=True
@@ -352,147 +451,91 @@ class CommonSegCodeSubsegment(Segment):
                     if self.parent:
                         self.parent.check_rodata_sym(func_addr, sym)
 
-                    self.update_access_mnemonic(sym, hi_insn.mnemonic)
+                    self.update_access_mnemonic(sym, hi_insn.raw_mnemonic)
 
                     func.insns[i].is_gp = True
                     func.insns[i].hi_lo_sym = sym
                     func.insns[i].sym_offset_str = offset_str
                 # All hi/lo pairs start with a lui
-                elif hi_insn.mnemonic == "lui":
-                    op_split = hi_insn.op_str.split(", ")
-                    hi_reg = op_split[0]
-
-                    if not op_split[1].startswith("0x"):
-                        continue
-
-                    lui_val = int(op_split[1], 0)
-
-                    # Assumes all luis are going to load from 0x80000000 or higher (maybe false)
-                    if lui_val >= 0x8000:
-                        # Iterate over the next few instructions to see if we can find a matching lo
-                        for j in range(
-                            i + 1, min(i + hi_lo_max_distance, len(func.insns))
-                        ):
-                            lo_insn = func.insns[j].instruction
-
-                            s_op_split = lo_insn.op_str.split(", ")
-
-                            if lo_insn.mnemonic == "lui" and hi_reg == s_op_split[0]:
-                                break
-
-                            if lo_insn.mnemonic in ["addiu", "ori"]:
-                                lo_reg = s_op_split[-2]
-                            else:
-                                lo_reg = s_op_split[-1][
-                                    s_op_split[-1].rfind("(") + 1 : -1
-                                ]
-
-                            if hi_reg == lo_reg:
-                                if lo_insn.mnemonic not in [
-                                    "addiu",
-                                    "lw",
-                                    "sw",
-                                    "lh",
-                                    "sh",
-                                    "lhu",
-                                    "lb",
-                                    "sb",
-                                    "lbu",
-                                    "lwc1",
-                                    "swc1",
-                                    "ldc1",
-                                    "sdc1",
-                                ]:
-                                    break
-
-                                # Match!
-                                reg_ext = ""
-
-                                # I forgot what this is doing
-                                junk_search = re.search(r"[\(]", s_op_split[-1])
-                                if junk_search is not None:
-                                    if junk_search.start() == 0:
-                                        break
-                                    s_str = s_op_split[-1][: junk_search.start()]
-                                    reg_ext = s_op_split[-1][junk_search.start() :]
-                                else:
-                                    s_str = s_op_split[-1]
-
-                                if options.get_compiler() == SN64:
-                                    reg_ext = CommonSegCodeSubsegment.replace_reg_names(
-                                        reg_ext
-                                    )
-
-                                symbol_addr = (lui_val * 0x10000) + int(s_str, 0)
-
-                                sym: Optional[Symbol] = None
-                                offset_str = ""
-
-                                # If the symbol is likely in the rodata section
-                                if (
-                                    not self.parent.text_follows_rodata
-                                    and symbol_addr > func_addr
-                                ) or (
-                                    self.parent.text_follows_rodata
-                                    and symbol_addr < func_addr
-                                ):
-                                    # Sanity check that the symbol is within this segment's vram
-                                    if (
-                                        self.parent.vram_end
-                                        and symbol_addr < self.parent.vram_end
-                                    ):
-                                        # If we've seen possible jumps to a jumptable and this symbol isn't too close to the end of the function
-                                        if (
-                                            len(possible_jtbl_jumps) > 0
-                                            and func_end_addr - lo_insn.address >= 0x30
-                                        ):
-                                            for jump in possible_jtbl_jumps:
-                                                if jump[1] == s_op_split[0]:
-                                                    dist_to_jump = (
-                                                        possible_jtbl_jumps[0][0]
-                                                        - lo_insn.address
-                                                    )
-                                                    if dist_to_jump <= 16:
-                                                        sym = self.parent.create_symbol(
-                                                            symbol_addr,
-                                                            reference=True,
-                                                            type="jtbl",
-                                                            local_only=True,
-                                                        )
-
-                                                        self.parent.jumptables[
-                                                            symbol_addr
-                                                        ] = (func_addr, func_end_addr)
-                                                        break
-
-                                if not sym:
-                                    sym = self.parent.create_symbol(
-                                        symbol_addr, offsets=True, reference=True
-                                    )
-                                    offset = symbol_addr - sym.vram_start
-                                    if offset != 0:
-                                        offset_str = f"+0x{offset:X}"
-
-                                if self.parent:
-                                    self.parent.check_rodata_sym(func_addr, sym)
-
-                                self.update_access_mnemonic(sym, lo_insn.mnemonic)
-
-                                func.insns[i].is_hi = True
-                                func.insns[i].hi_lo_sym = sym
-                                func.insns[i].sym_offset_str = offset_str
-
-                                func.insns[j].is_lo = True
-                                func.insns[j].hi_lo_sym = sym
-                                func.insns[j].sym_offset_str = offset_str
-                                func.insns[j].hi_lo_reg = reg_ext
-                                break
+                elif i in pairs:
+                    j = pairs[i]
+                    lo_insn = func.insns[j]
+                    lui_val = mips.get_imm(hi_insn.word)
+
+                    reg_ext = ""
+                    lo_offset = mips.get_simm(lo_insn.word)
+
+                    paren_pos = lo_insn.raw_op_str.rfind("(")
+                    if paren_pos != -1:
+                        reg_ext = lo_insn.raw_op_str[paren_pos:]
+
+                    if options.get_compiler() == SN64:
+                        reg_ext = CommonSegCodeSubsegment.replace_reg_names(reg_ext)
+
+                    symbol_addr = (lui_val * 0x10000) + lo_offset
+
+                    sym = None
+                    offset_str = ""
+
+                    # If the symbol is likely in the rodata section
+                    if (
+                        not self.parent.text_follows_rodata and symbol_addr > func_addr
+                    ) or (self.parent.text_follows_rodata and symbol_addr < func_addr):
+                        # Sanity check that the symbol is within this segment's vram
+                        if self.parent.vram_end and symbol_addr < self.parent.vram_end:
+                            # If we've seen possible jumps to a jumptable and this symbol isn't too close to the end of the function
+                            if (
+                                jtbl_cursor < jtbl_end
+                                and func_end_addr - lo_insn.address >= 0x30
+                            ):
+                                lo_rt = lo_insn.raw_op_str.split(", ")[0]
+                                for k in range(jtbl_cursor, jtbl_end):
+                                    if jtbl_jumps[jtbl_addrs[k]] == lo_rt:
+                                        dist_to_jump = (
+                                            jtbl_addrs[jtbl_cursor] - lo_insn.address
+                                        )
+                                        if dist_to_jump <= 16:
+                                            sym = self.parent.create_symbol(
+                                                symbol_addr,
+                                                reference=True,
+                                                type="jtbl",
+                                                local_only=True,
+                                            )
+
+                                            self.parent.jumptables[symbol_addr] = (
+                                                func_addr,
+                                                func_end_addr,
+                                            )
+                                            break
+
+                    if not sym:
+                        sym = self.parent.create_symbol(
+                            symbol_addr, offsets=True, reference=True
+                        )
+                        offset = symbol_addr - sym.vram_start
+                        if offset != 0:
+                            offset_str = f"+0x{offset:X}"
+
+                    if self.parent:
+                        self.parent.check_rodata_sym(func_addr, sym)
+
+                    self.update_access_mnemonic(sym, lo_insn.raw_mnemonic)
+
+                    func.insns[i].is_hi = True
+                    func.insns[i].hi_lo_sym = sym
+                    func.insns[i].sym_offset_str = offset_str
+
+                    func.insns[j].is_lo = True
+                    func.insns[j].hi_lo_sym = sym
+                    func.insns[j].sym_offset_str = offset_str
+                    func.insns[j].hi_lo_reg = reg_ext
 
     def add_labels(self):
         ret = {}
 
         function_macro = options.get_asm_function_macro()
         data_macro = options.get_asm_data_macro()
+        endianness = options.get_endianess()
 
         for func_addr in self.funcs:
             func_text = []
@@ -511,7 +554,7 @@ class CommonSegCodeSubsegment(Segment):
             rom_addr_padding = options.rom_address_padding()
 
             for insn in func.insns:
-                insn_addr = insn.instruction.address
+                insn_addr = insn.address
                 # Add a label if we need one
                 if insn_addr in self.parent.jtbl_glabels_to_add:
                     func_text.append(f"{data_macro} L{insn_addr:X}_{insn.rom_addr:X}")
@@ -528,7 +571,9 @@ class CommonSegCodeSubsegment(Segment):
                     asm_comment = ""
                 else:
                     asm_comment = "/* {} {:X} {} */".format(
-                        rom_str, insn_addr, insn.instruction.bytes.hex().upper()
+                        rom_str,
+                        insn_addr,
+                        insn.word.to_bytes(4, endianness).hex().upper(),
                     )
 
                 if insn.is_hi:
@@ -553,8 +598,8 @@ class CommonSegCodeSubsegment(Segment):
                 else:
                     op_str = insn.op_str
 
-                if self.is_branch_insn(insn.instruction.mnemonic):
-                    branch_addr = int(insn.instruction.op_str.split(",")[-1].strip(), 0)
+                if self.is_branch_insn(insn.raw_mnemonic) and mips.is_branch(insn.word):
+                    branch_addr = mips.get_target(insn.word, insn.address)
                     if branch_addr in self.parent.jtbl_glabels_to_add:
                         label_str = f"L{branch_addr:X}_{self.ram_to_rom(branch_addr):X}"
                         op_str = ", ".join(insn.op_str.split(", ")[:-1] + [label_str])
@@ -571,9 +616,9 @@ class CommonSegCodeSubsegment(Segment):
                 func_text.append(asm_comment + asm_insn_text)
 
                 if (
-                    insn.instruction.mnemonic != "branch"
-                    and insn.instruction.mnemonic.startswith("b")
-                    or insn.instruction.mnemonic.startswith("j")
+                    insn.raw_mnemonic != "branch"
+                    and insn.raw_mnemonic.startswith("b")
+                    or insn.raw_mnemonic.startswith("j")
                 ):
                     indent_next = True
 
@@ -591,10 +636,10 @@ class CommonSegCodeSubsegment(Segment):
                     # Find where the function returns
                     jr_pos: Optional[int] = None
                     for i, insn in enumerate(reversed(func.insns)):
-                        if (
-                            insn.instruction.mnemonic == "jr"
-                            and insn.instruction.op_str in ["$ra", "$31"]
-                        ):
+                        if insn.raw_mnemonic == "jr" and insn.raw_op_str in [
+                            "$ra",
+                            "$31",
+                        ]:
                             jr_pos = i
                             break
 
@@ -602,9 +647,7 @@ class CommonSegCodeSubsegment(Segment):
                     if (
                         jr_pos is not None
                         and jr_pos > 1
-                        and self.is_nops(
-                            [insn.instruction for insn in func.insns[-jr_pos + 1 :]]
-                        )
+                        and self.is_nops(func.insns[-jr_pos + 1 :])
                     ):
                         new_file_addr = func.insns[-1].rom_addr + 4
                         if (new_file_addr % 16) == 0:
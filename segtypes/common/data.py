@@ -2,9 +2,10 @@ from segtypes.common.code import CommonSegCode
 from segtypes.common.codesubsegment import CommonSegCodeSubsegment
 from segtypes.common.group import CommonSegGroup
 from pathlib import Path
-from typing import List, Optional
+from typing import Dict, List, Optional
 from util.symbols import Symbol
-from util import floats, options
+from util import floats, options, strings, symbols
+from util.mips import np, warn_no_numpy
 
 
 class CommonSegData(CommonSegCodeSubsegment, CommonSegGroup):
@@ -55,11 +56,14 @@ class CommonSegData(CommonSegCodeSubsegment, CommonSegGroup):
     def get_linker_entries(self):
         return CommonSegCodeSubsegment.get_linker_entries(self)
 
-    # Check symbols marked as jump tables to be valid
+    # Check symbols marked as jump tables to be valid, splitting each one where it stops looking like a jump table.
+    # The symbol created at a split comes next, so it gets checked in the same pass if it's a jump table too
     def check_jtbls(self, rom_bytes, syms: List[Symbol]):
         endianness = options.get_endianess()
 
-        for i, sym in enumerate(syms):
+        i = 0
+        while i < len(syms):
+            sym = syms[i]
             if sym.type == "jtbl":
                 start = self.get_most_parent().ram_to_rom(syms[i].vram_start)
                 assert isinstance(start, int)
@@ -89,27 +93,60 @@ class CommonSegData(CommonSegCodeSubsegment, CommonSegGroup):
                                 new_sym_ram_start, define=True, local_only=True
                             ),
                         )
-                        return False
+                        break
 
                     if bits != 0:
                         last_bits = bits
                     b += 4
 
-        return True
+            i += 1
+
+    # Every distinct word in this segment that points into it, in the order they first appear
+    def get_inter_data_pointers(self, rom_bytes) -> List[int]:
+        endian = options.get_endianess()
+
+        if np is None or self.vram_start is None or self.vram_end is None:
+            if np is None:
+                warn_no_numpy()
+
+            pointers: Dict[int, None] = {}
+            for i in range(self.rom_start, self.rom_end, 4):
+                bits = int.from_bytes(rom_bytes[i : i + 4], endian)
+                if self.contains_vram(bits):
+                    pointers[bits] = None
+            return list(pointers)
+
+        # The segment's whole words that are in the rom are read as one array and filtered at once
+        count = max(0, min(self.rom_end, len(rom_bytes)) - self.rom_start) // 4
+        ret: List[int] = []
+        if count > 0:
+            words = np.frombuffer(
+                rom_bytes,
+                dtype=">u4" if endian == "big" else "<u4",
+                count=count,
+                offset=self.rom_start,
+            )
+            words = words[(words >= self.vram_start) & (words < self.vram_end)]
+            _, first_seen = np.unique(words, return_index=True)
+            ret = words[np.sort(first_seen)].tolist()
+
+        # A partial last word, or whatever part of the segment is past the end of the rom, is read like it
+        # always has been
+        for i in range(self.rom_start + count * 4, self.rom_end, 4):
+            bits = int.from_bytes(rom_bytes[i : i + 4], endian)
+            if self.contains_vram(bits) and bits not in ret:
+                ret.append(bits)
+
+        return ret
 
     def get_symbols(self, rom_bytes) -> List[Symbol]:
         symset = set()
-        endian = options.get_endianess()
 
         # Find inter-data symbols
-        for i in range(self.rom_start, self.rom_end, 4):
-            bits = int.from_bytes(rom_bytes[i : i + 4], endian)
-            if self.contains_vram(bits):
-                symset.add(
-                    self.get_most_parent().create_symbol(
-                        bits, define=True, local_only=True
-                    )
-                )
+        for bits in self.get_inter_data_pointers(rom_bytes):
+            symset.add(
+                self.get_most_parent().create_symbol(bits, define=True, local_only=True)
+            )
 
         for symbol_addr in self.seg_symbols:
             for symbol in self.seg_symbols[symbol_addr]:
@@ -131,84 +168,13 @@ class CommonSegData(CommonSegCodeSubsegment, CommonSegGroup):
         # Make a dummy symbol here that marks the end of the previous symbol's disasm range
         ret.append(Symbol(self.vram_end))
 
-        while True:
-            valid = self.check_jtbls(rom_bytes, ret)
-            if valid:
-                break
+        self.check_jtbls(rom_bytes, ret)
 
         return ret
 
-    def are_null(chars):
-        for b in chars:
-            if b != "\x00":
-                return False
-        return True
-
     @staticmethod
-    def is_valid_ascii(bytes):
-        null_char = "\x00"
-        valid_chars = (
-            "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890[]():%!#=-_ "
-        )
-        invalid_chars = ""
-        duplicate_limit = 10
-
-        last_char = 0
-        true_end = None
-        consecutive_duplicates = 0
-        valid_count = 0
-
-        if len(bytes) <= 4 or bytes[0] == 0:
-            return False
-
-        try:
-            chars = bytes.decode("EUC-JP")
-        except:
-            return False
-
-        if len(chars) <= 4:
-            return False
-
-        for i, c in enumerate(chars):
-            # Ensure null bytes are only at the end of ascii strings
-            # TODO: if we find null bytes in the middle, break this into multiple strings ?
-            if c == null_char:
-                if true_end is None:
-                    if CommonSegData.are_null(chars[i:]):
-                        true_end = i
-                    else:
-                        pass
-                        # return False
-
-            # Ensure we're not seeing a ton of the same character in a row
-            if last_char == c:
-                consecutive_duplicates += 1
-                if consecutive_duplicates >= duplicate_limit and last_char != null_char:
-                    return False
-            else:
-                consecutive_duplicates = 0
-
-            if c in valid_chars:
-                valid_count += 1
-            elif c in invalid_chars:
-                return False
-
-            last_char = c
-
-        # Ensure the number of valid characters is sufficient
-        if true_end is not None:
-            # If there are more than 16 null chars at the end, something is afoot
-            if len(chars) - true_end > 16:
-                return False
-            end = true_end
-        else:
-            end = len(chars)
-
-        valid_ratio = valid_count / end
-        if valid_ratio >= 0.75:
-            return True
-
-        return False
+    def is_valid_ascii(data):
+        return strings.is_valid_ascii(data)
 
     # TODO if we see a new function's jtbl, split it
     def is_valid_jtbl(self, sym: Symbol, bytes) -> bool:
@@ -242,6 +208,7 @@ class CommonSegData(CommonSegCodeSubsegment, CommonSegGroup):
 
         # Mark this symbol as a jump table and record the jump table for later
         sym.type = "jtbl"
+        symbols.invalidate_names()
         most_parent.jumptables[sym.vram_start] = (
             jtbl_func.vram_start,
             jtbl_func.vram_end,
@@ -266,7 +233,7 @@ class CommonSegData(CommonSegCodeSubsegment, CommonSegGroup):
 
         if sym_type == "ascii":
             try:
-                ascii_str = sym_bytes.decode("EUC-JP")
+                ascii_str = str(sym_bytes, "EUC-JP")
                 # ascii_str = ascii_str.rstrip("\x00")
                 ascii_str = ascii_str.replace("\\", "\\\\")  # escape back slashes
                 ascii_str = ascii_str.replace('"', '\\"')  # escape quotes
@@ -278,6 +245,7 @@ class CommonSegData(CommonSegCodeSubsegment, CommonSegGroup):
             except:
                 return self.disassemble_symbol(sym_bytes, "word")
 
+        byte_strs: List[str] = []
         i = 0
         while i < len(sym_bytes):
             adv_amt = min(slen, len(sym_bytes) - i)
@@ -315,25 +283,24 @@ class CommonSegData(CommonSegCodeSubsegment, CommonSegGroup):
                 else:
                     byte_str = float_str
 
-            sym_str += byte_str
-
+            byte_strs.append(byte_str)
             i += adv_amt
 
-            if i < len(sym_bytes):
-                sym_str += ", "
-
-        return sym_str
+        return sym_str + ", ".join(byte_strs)
 
     def disassemble_data(self, rom_bytes):
         rodata_encountered = "rodata" in self.type
-        ret = '.include "macro.inc"\n\n'
-        ret += f".section {self.get_linker_section()}"
+        # The file's text is collected in pieces and joined once at the end
+        ret = ['.include "macro.inc"\n\n', f".section {self.get_linker_section()}"]
 
         if self.size == 0:
             return None
 
         syms = self.get_symbols(rom_bytes)
 
+        # Only built once a symbol could be a string, so segments without any never pay for it
+        string_classifier: Optional[strings.StringClassifier] = None
+
         for i in range(len(syms) - 1):
             mnemonic = syms[i].access_mnemonic
             sym = self.get_most_parent().create_symbol(
@@ -349,8 +316,15 @@ class CommonSegData(CommonSegCodeSubsegment, CommonSegGroup):
             else:
                 sym_bytes = rom_bytes[dis_start:dis_end]
 
+                if mnemonic == "addiu" and string_classifier is None:
+                    string_classifier = strings.StringClassifier(
+                        rom_bytes, self.rom_start, self.rom_end
+                    )
+
                 # Checking if the mnemonic is addiu may be too picky - we'll see
-                if self.is_valid_ascii(sym_bytes) and mnemonic == "addiu":
+                if mnemonic == "addiu" and string_classifier.is_valid_ascii(
+                    dis_start, dis_end
+                ):
                     stype = "ascii"
                 elif sym.type == "jtbl":
                     stype = "jtbl"
@@ -400,14 +374,15 @@ class CommonSegData(CommonSegCodeSubsegment, CommonSegGroup):
                     and self.get_most_parent().rodata_follows_data
                 ):
                     rodata_encountered = True
-                    ret += "\n\n\n.section .rodata"
+                    ret.append("\n\n\n.section .rodata")
 
                 disasm_str = self.disassemble_symbol(sym_bytes, stype)
 
             sym.disasm_str = disasm_str
             name_str = f"\n\n{options.get_asm_data_macro()} {sym.name}\n"
-            ret += name_str + disasm_str
+            ret.append(name_str)
+            ret.append(disasm_str)
 
-        ret += "\n"
+        ret.append("\n")
 
-        return ret
+        return "".join(ret)
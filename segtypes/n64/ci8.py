@@ -41,6 +41,11 @@ class N64SegCi8(N64SegRgba16):
         self.palette: "Optional[Palette]" = None
         self.palette_name = self.name
 
+    # Marks its raster/palette sibling as extracted
+    @property
+    def splits_independently(self) -> bool:
+        return False
+
     def split(self, rom_bytes):
         path = options.get_asset_path() / self.dir / (self.name + ".png")
         path.parent.mkdir(parents=True, exist_ok=True)
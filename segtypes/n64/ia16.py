@@ -2,7 +2,8 @@ from segtypes.n64.ia4 import N64SegIa4
 
 
 class N64SegIa16(N64SegIa4):
-    def parse_image(self, data):
+    @staticmethod
+    def parse_image(data, width, height, flip_h=False, flip_v=False):
         return data
 
     def max_length(self):
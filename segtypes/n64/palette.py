@@ -71,6 +71,11 @@ class N64SegPalette(N64Segment):
                         f"Error: {self.name} should end at 0x{self.rom_start + expected_len:X}, but it ends at 0x{self.rom_end:X}\n(hint: add a 'bin' segment after it)"
                     )
 
+    # Marks its raster/palette sibling as extracted
+    @property
+    def splits_independently(self) -> bool:
+        return False
+
     def should_split(self):
         return self.extract and (super().should_split() or options.mode_active("img"))
 
@@ -1,12 +1,14 @@
 import importlib
 import importlib.util
 
-from typing import Dict, TYPE_CHECKING, Type, Union, Optional, List
+from typing import Dict, TYPE_CHECKING, Set, Tuple, Type, Union, Optional, List
 from pathlib import Path
 
+from util import cache as seg_cache
 from util import log
 from util import options
 from util import symbols
+from util.intervals import IntervalIndex
 from util.symbols import Symbol
 
 # circular import
@@ -178,6 +180,31 @@ class Segment:
         self.warnings: List[str] = []
         self.did_run = False
 
+        # What the cache records about this segment's lookups, only on top-level segments in --use-cache runs.
+        # Addresses outside of this segment that its scan looked symbols up at
+        self.ext_refs: Set[int] = set()
+
+        # Lookups during the scan or split that found nothing, as (address, in this segment, type, dead allowed)
+        self.missed_lookups: Set[Tuple[int, bool, Optional[str], bool]] = set()
+
+        # Symbols that already existed when the scan first found them, with their state at that point
+        self.found_symbols: Dict[int, Tuple[Symbol, symbols.SymbolState]] = {}
+
+        # The funcs in seg_symbols by vram, for get_func_for_addr (only built on top-level segments). Rebuilt
+        # when a func gets added or changes size
+        self.func_index: Optional[IntervalIndex[Symbol]] = None
+        self.func_index_symbols: Optional[List[Symbol]] = None
+        self.func_index_version = 0
+        self.func_index_count = 0
+
+        # The symbols in seg_symbols by name, for get_symbol_by_name (only built on top-level segments).
+        # Symbols created since it was built get added to it, and it's rebuilt when existing ones can have
+        # been renamed
+        self.name_index: Optional[Dict[str, List[Symbol]]] = None
+        self.name_index_symbols: Optional[List[Symbol]] = None
+        self.name_index_version = 0
+        self.name_index_count = 0
+
         if isinstance(self.rom_start, int) and isinstance(self.rom_end, int):
             if self.rom_start > self.rom_end:
                 log.error(
@@ -223,6 +250,11 @@ class Segment:
     def needs_symbols(self) -> bool:
         return False
 
+    # Whether split() only affects this segment and the files it writes, so it can run in a worker process
+    @property
+    def splits_independently(self) -> bool:
+        return True
+
     @property
     def dir(self) -> Path:
         if self.parent:
@@ -399,16 +431,13 @@ class Segment:
         if k not in d:
             return None
 
-        if t:
-            items = [s for s in d[k] if s.type == t or s.type == "unknown"]
-        else:
-            items = d[k]
+        # Picks the first match without building a list of them. Types can change after a symbol's been
+        # added (data becoming a jtbl), so they're checked here rather than kept in the dict's keys
+        for sym in d[k]:
+            if not t or sym.type == t or sym.type == "unknown":
+                return sym
 
-        if len(items) > 1:
-            pass  # print(f"Trying to retrieve {k:X} from symbol dict but there are {len(items)} entries to pick from - picking the first")
-        if len(items) == 0:
-            return None
-        return items[0]
+        return None
 
     def get_symbol(
         self,
@@ -441,6 +470,9 @@ class Segment:
         if not dead and ret and ret.dead:
             ret = None
 
+        if seg_cache.recording and (in_segment or not local_only):
+            seg_cache.record_lookup(self, addr, in_segment, type, dead, ret)
+
         # Create the symbol if it doesn't exist
         if not ret and create:
             ret = Symbol(addr, rom=rom, type=type)
@@ -489,10 +521,70 @@ class Segment:
 
         return ret
 
+    def get_symbol_by_name(self, name: str) -> Optional[Symbol]:
+        all_symbols = symbols.all_symbols
+        seg_symbols = self.seg_symbols
+
+        if (
+            self.name_index is None
+            or self.name_index_symbols is not all_symbols
+            or self.name_index_version != symbols.names_version
+        ):
+            self.name_index = {}
+            for syms in seg_symbols.values():
+                for sym in syms:
+                    self.name_index.setdefault(sym.name, []).append(sym)
+
+            self.name_index_symbols = all_symbols
+            self.name_index_version = symbols.names_version
+        else:
+            for sym in all_symbols[self.name_index_count :]:
+                if any(s is sym for s in seg_symbols.get(sym.vram_start, [])):
+                    self.name_index.setdefault(sym.name, []).append(sym)
+
+        self.name_index_count = len(all_symbols)
+
+        matches = [sym for sym in self.name_index.get(name, []) if sym.name == name]
+
+        if len(matches) > 1:
+            # Several symbols share the name, so take whichever seg_symbols has first
+            for syms in seg_symbols.values():
+                for sym in syms:
+                    if sym.name == name:
+                        return sym
+
+        return matches[0] if matches else None
+
+    def get_func_index(self) -> IntervalIndex[Symbol]:
+        all_symbols = symbols.all_symbols
+
+        stale = (
+            self.func_index is None
+            or self.func_index_symbols is not all_symbols
+            or self.func_index_version != symbols.funcs_version
+            # Symbols created since the last build only matter if they're funcs
+            or any(sym.type == "func" for sym in all_symbols[self.func_index_count :])
+        )
+
+        if stale:
+            self.func_index = IntervalIndex(
+                (sym.vram_start, sym.vram_end, sym)
+                for syms in self.seg_symbols.values()
+                for sym in syms
+                if sym.type == "func"
+            )
+            self.func_index_symbols = all_symbols
+            self.func_index_version = symbols.funcs_version
+
+        self.func_index_count = len(all_symbols)
+
+        assert self.func_index is not None
+        return self.func_index
+
     def get_func_for_addr(self, addr) -> Optional[Symbol]:
-        for syms in self.seg_symbols.values():
-            for sym in syms:
-                if sym.type == "func" and sym.contains_vram(addr):
-                    return sym
+        # A func can have been retyped since the index was built (as a jump table, say)
+        for sym in self.get_func_index().find(addr):
+            if sym.type == "func":
+                return sym
 
         return None
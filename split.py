@@ -1,11 +1,13 @@
 #! /usr/bin/env python3
 
 import hashlib
+import mmap
+import multiprocessing
+import sys
 from typing import Dict, List, Union, Set, Any
 import argparse
 import pylibyaml
 import yaml
-import pickle
 from colorama import Style, Fore
 from segtypes.segment import Segment
 from segtypes.linker_entry import LinkerWriter, to_cname
@@ -13,6 +15,9 @@ from util import log
 from util import options
 from util import symbols
 from util import palettes
+from util import partition
+from util import cache as seg_cache
+from util import profiler
 
 VERSION = "0.8.1.0"
 
@@ -27,10 +32,26 @@ parser.add_argument("--verbose", action="store_true", help="Enable debug logging
 parser.add_argument(
     "--use-cache", action="store_true", help="Only split changed segments in config"
 )
+parser.add_argument(
+    "--jobs",
+    type=int,
+    default=1,
+    help="Number of processes to split segments with (requires fork)",
+)
+parser.add_argument(
+    "--profile",
+    action="store_true",
+    help="Time each phase and segment and write a report to splat_profile.json",
+)
 
 linker_writer: LinkerWriter
 config: Dict[str, Any]
 
+# State shared with split worker processes. The workers are forked after the scan, so they
+# inherit the scanned segments and symbols rather than having them pickled over
+pool_segments: List[Segment] = []
+pool_rom_bytes: bytes = b""
+
 
 def fmt_size(size):
     if size > 1000000:
@@ -72,31 +93,78 @@ def initialize_segments(config_segments: Union[dict, list]) -> List[Segment]:
     return ret
 
 
-def get_segment_symbols(segment, all_segments):
-    seg_syms = {}
-    other_syms = {}
+def split_worker(index: int):
+    segment = pool_segments[index]
+    exit_code = None
 
-    for symbol in symbols.all_symbols:
-        if symbols.is_symbol_isolated(symbol, all_segments) and not symbol.rom:
-            if segment.contains_vram(symbol.vram_start):
-                if symbol.vram_start not in seg_syms:
-                    seg_syms[symbol.vram_start] = []
-                seg_syms[symbol.vram_start].append(symbol)
-            else:
-                if symbol.vram_start not in other_syms:
-                    other_syms[symbol.vram_start] = []
-                other_syms[symbol.vram_start].append(symbol)
-        else:
-            if symbol.rom and segment.contains_rom(symbol.rom):
-                if symbol.vram_start not in seg_syms:
-                    seg_syms[symbol.vram_start] = []
-                seg_syms[symbol.vram_start].append(symbol)
-            else:
-                if symbol.vram_start not in other_syms:
-                    other_syms[symbol.vram_start] = []
-                other_syms[symbol.vram_start].append(symbol)
+    with profiler.measure("split", segment) as record:
+        try:
+            segment.split(pool_rom_bytes)
+        except SystemExit as e:
+            # log.error exits; hand the code back so the main process can exit with it
+            exit_code = e.code
+        finally:
+            sys.stdout.flush()
+
+    # The cache entry needs the lookups the split missed, which only this process saw
+    return segment.warnings, exit_code, record, segment.missed_lookups
 
-    return seg_syms, other_syms
+
+def split_segments(segments: List[Segment], rom_bytes, jobs: int):
+    global pool_segments
+    global pool_rom_bytes
+
+    if jobs > 1:
+        try:
+            ctx = multiprocessing.get_context("fork")
+        except ValueError:
+            log.write("--jobs is not supported on this platform, splitting serially")
+            jobs = 1
+
+    # Segments whose split touches other segments (e.g. palettes and rasters) stay in this process
+    pool_segments = [s for s in segments if s.should_split() and s.splits_independently]
+
+    if jobs <= 1 or len(pool_segments) == 0:
+        for segment in segments:
+            if segment.should_split():
+                with profiler.measure("split", segment):
+                    segment.split(rom_bytes)
+            log.dot(status=segment.status())
+        return
+
+    pool_rom_bytes = rom_bytes
+    pool_indices = {id(s): i for i, s in enumerate(pool_segments)}
+
+    sys.stdout.flush()
+    with ctx.Pool(jobs) as pool:
+        results = [
+            pool.apply_async(split_worker, (i,)) for i in range(len(pool_segments))
+        ]
+
+        for segment in segments:
+            if id(segment) in pool_indices:
+                warnings, exit_code, record, missed_lookups = results[
+                    pool_indices[id(segment)]
+                ].get()
+                if exit_code is not None:
+                    sys.exit(exit_code)
+                segment.warnings = warnings
+                segment.missed_lookups |= missed_lookups
+                profiler.add(record)
+            elif segment.should_split():
+                with profiler.measure("split", segment):
+                    segment.split(rom_bytes)
+
+            log.dot(status=segment.status())
+
+    pool_segments = []
+    pool_rom_bytes = b""
+
+
+def get_stat_type(segment: Segment) -> str:
+    if segment.type == "bin" and segment.is_name_default():
+        return "unk"
+    return segment.type
 
 
 def do_statistics(seg_sizes, rom_bytes, seg_split, seg_cached):
@@ -152,32 +220,46 @@ def merge_configs(main_config, additional_config):
     return main_config
 
 
-def main(config_path, base_dir, target_path, modes, verbose, use_cache=True):
+def main(
+    config_path,
+    base_dir,
+    target_path,
+    modes,
+    verbose,
+    use_cache=True,
+    jobs=1,
+    profile=False,
+):
     global config
 
     log.write(f"splat {VERSION}")
 
+    if profile:
+        profiler.start()
+
     # Load config
-    config = {}
-    for entry in config_path:
-        with open(entry) as f:
-            additional_config = yaml.load(f.read(), Loader=yaml.SafeLoader)
-        config = merge_configs(config, additional_config)
+    with profiler.measure("config"):
+        config = {}
+        for entry in config_path:
+            with open(entry) as f:
+                additional_config = yaml.load(f.read(), Loader=yaml.SafeLoader)
+            config = merge_configs(config, additional_config)
 
-    options.initialize(config, config_path, base_dir, target_path)
-    options.set("modes", modes)
+        options.initialize(config, config_path, base_dir, target_path)
+        options.set("modes", modes)
 
-    if verbose:
-        options.set("verbose", True)
+        if verbose:
+            options.set("verbose", True)
 
-    with options.get_target_path().open("rb") as f2:
-        rom_bytes = f2.read()
+        # Segments get slices of a read-only view of the mapped file, so slicing never copies
+        with options.get_target_path().open("rb") as f2:
+            rom_bytes = memoryview(mmap.mmap(f2.fileno(), 0, access=mmap.ACCESS_READ))
 
-    if "sha1" in config:
-        sha1 = hashlib.sha1(rom_bytes).hexdigest()
-        e_sha1 = config["sha1"].lower()
-        if e_sha1 != sha1:
-            log.error(f"sha1 mismatch: expected {e_sha1}, was {sha1}")
+        if "sha1" in config:
+            sha1 = hashlib.sha1(rom_bytes).hexdigest()
+            e_sha1 = config["sha1"].lower()
+            if e_sha1 != sha1:
+                log.error(f"sha1 mismatch: expected {e_sha1}, was {sha1}")
 
     # Create main output dir
     options.get_base_path().mkdir(parents=True, exist_ok=True)
@@ -188,134 +270,135 @@ def main(config_path, base_dir, target_path, modes, verbose, use_cache=True):
     seg_split: Dict[str, int] = {}
     seg_cached: Dict[str, int] = {}
 
-    # Load cache
-    if use_cache:
-        try:
-            with options.get_cache_path().open("rb") as f3:
-                cache = pickle.load(f3)
-
-            if verbose:
-                log.write(f"Loaded cache ({len(cache.keys())} items)")
-        except Exception:
-            cache = {}
-    else:
-        cache = {}
-
-    # invalidate entire cache if options change
-    if use_cache and cache.get("__options__") != config.get("options"):
-        if verbose:
-            log.write("Options changed, invalidating cache")
+    # Prepare cache
+    if use_cache and not seg_cache.prepare_dir() and verbose:
+        log.write("No cache found, splitting all segments")
 
-        cache = {
-            "__options__": config.get("options"),
-        }
+    seg_cache.reset()
+    cached_segments: Set[Segment] = set()
+    scan_results: Dict[Segment, seg_cache.ScanResult] = {}
+    cache_entries: List[Dict[str, Any]] = []
 
     # Initialize segments
     all_segments = initialize_segments(config["segments"])
 
     # Load and process symbols
-    if options.mode_active("code"):
-        log.write("Loading and processing symbols")
-        symbols.initialize(all_segments)
+    with profiler.measure("symbols"):
+        if options.mode_active("code"):
+            log.write("Loading and processing symbols")
+            symbols.initialize(all_segments)
 
     # Resolve raster/palette siblings
-    if options.mode_active("img"):
-        palettes.initialize(all_segments)
+    with profiler.measure("palettes"):
+        if options.mode_active("img"):
+            palettes.initialize(all_segments)
 
     # Scan
-    log.write("Starting scan")
-    for segment in all_segments:
-        typ = segment.type
-        if segment.type == "bin" and segment.is_name_default():
-            typ = "unk"
-
-        if typ not in seg_sizes:
-            seg_sizes[typ] = 0
-            seg_split[typ] = 0
-            seg_cached[typ] = 0
-        seg_sizes[typ] += 0 if segment.size is None else segment.size
-
-        if segment.should_scan():
-            # Check cache but don't write anything
-            if use_cache:
-                if segment.cache() == cache.get(segment.unique_id()):
-                    continue
-
-            if segment.needs_symbols:
-                segment_symbols, other_symbols = get_segment_symbols(
-                    segment, all_segments
-                )
-                segment.given_seg_symbols = segment_symbols
-                segment.given_ext_symbols = other_symbols
+    partition.initialize(all_segments)
+    with profiler.measure("scan"):
+        log.write("Starting scan")
+        for segment in all_segments:
+            typ = get_stat_type(segment)
 
-            segment.did_run = True
-            segment.scan(rom_bytes)
+            if typ not in seg_sizes:
+                seg_sizes[typ] = 0
+                seg_split[typ] = 0
+                seg_cached[typ] = 0
+            seg_sizes[typ] += 0 if segment.size is None else segment.size
 
-            processed_segments.append(segment)
+            with profiler.measure("scan", segment):
+                if use_cache:
+                    entry = seg_cache.load_entry(segment.unique_id())
+                    hit = seg_cache.is_hit(segment, rom_bytes, entry)
 
-            seg_split[typ] += 1
+                    # Cached segments are neither scanned nor split; the symbols their last scan found or
+                    # created are restored instead
+                    if hit and seg_cache.restore_scan(segment, all_segments, entry):
+                        cached_segments.add(segment)
+                        log.dot(status=segment.status())
+                        continue
 
-        log.dot(status=segment.status())
+                if segment.should_scan():
+                    if segment.needs_symbols:
+                        partition.assign(segment, all_segments)
 
-    # Split
-    log.write("Starting split")
-    for segment in all_segments:
-        if use_cache:
-            cached = segment.cache()
+                    segment.did_run = True
 
-            if cached == cache.get(segment.unique_id()):
-                # Cache hit
-                seg_cached[typ] += 1
-                continue
-            else:
-                # Cache miss; split
-                cache[segment.unique_id()] = cached
+                    if use_cache:
+                        scan_begin = seg_cache.begin_scan(segment)
+                        segment.scan(rom_bytes)
+                        scan_results[segment] = seg_cache.end_scan(segment, scan_begin)
+                    else:
+                        segment.scan(rom_bytes)
 
-        if segment.should_split():
-            segment.split(rom_bytes)
+                    processed_segments.append(segment)
 
-        log.dot(status=segment.status())
+                    seg_split[typ] += 1
 
-    if options.mode_active("ld"):
-        global linker_writer
-        linker_writer = LinkerWriter()
+                log.dot(status=segment.status())
+
+    # Split
+    with profiler.measure("split"):
+        log.write("Starting split")
+        to_split: List[Segment] = []
         for segment in all_segments:
-            linker_writer.add(segment)
-        linker_writer.save_linker_script()
-        linker_writer.save_symbol_header()
-
-        # write elf_sections.txt - this only lists the generated sections in the elf, not subsections
-        # that the elf combines into one section
-        if options.get_create_elf_section_list_auto():
-            section_list = ""
+            if segment in cached_segments:
+                seg_cached[get_stat_type(segment)] += 1
+                continue
+
+            # Segments the active modes skip have nothing worth caching
+            if use_cache and segment.should_split():
+                # Cache miss; the key includes the external references found during the scan
+                cache_entries.append(
+                    seg_cache.make_entry(segment, rom_bytes, scan_results.get(segment))
+                )
+
+            to_split.append(segment)
+
+        if use_cache:
+            seg_cache.begin_split()
+        split_segments(to_split, rom_bytes, jobs)
+        if use_cache:
+            seg_cache.end_split()
+
+    with profiler.measure("ld"):
+        if options.mode_active("ld"):
+            global linker_writer
+            linker_writer = LinkerWriter()
             for segment in all_segments:
-                section_list += "." + to_cname(segment.name) + "\n"
-            with open(options.get_elf_section_list_path(), "w", newline="\n") as f:
-                f.write(section_list)
-
-    # Write undefined_funcs_auto.txt
-    if options.get_create_undefined_funcs_auto():
-        to_write = [
-            s
-            for s in symbols.all_symbols
-            if s.referenced and not s.defined and not s.dead and s.type == "func"
-        ]
-        if len(to_write) > 0:
-            with open(options.get_undefined_funcs_auto_path(), "w", newline="\n") as f:
-                for symbol in to_write:
-                    f.write(f"{symbol.name} = 0x{symbol.vram_start:X};\n")
-
-    # write undefined_syms_auto.txt
-    if options.get_create_undefined_syms_auto():
-        to_write = [
-            s
-            for s in symbols.all_symbols
-            if s.referenced and not s.defined and not s.dead and not s.type == "func"
-        ]
-        if len(to_write) > 0:
-            with open(options.get_undefined_syms_auto_path(), "w", newline="\n") as f:
-                for symbol in to_write:
-                    f.write(f"{symbol.name} = 0x{symbol.vram_start:X};\n")
+                linker_writer.add(segment)
+            linker_writer.save_linker_script()
+            linker_writer.save_symbol_header()
+
+            # write elf_sections.txt - this only lists the generated sections in the elf, not subsections
+            # that the elf combines into one section
+            if options.get_create_elf_section_list_auto():
+                section_list = ""
+                for segment in all_segments:
+                    section_list += "." + to_cname(segment.name) + "\n"
+                with open(options.get_elf_section_list_path(), "w", newline="\n") as f:
+                    f.write(section_list)
+
+    with profiler.measure("undefined"):
+        undefined_funcs, undefined_syms = symbols.get_undefined()
+
+        # Write undefined_funcs_auto.txt
+        if options.get_create_undefined_funcs_auto():
+            if len(undefined_funcs) > 0:
+                with open(
+                    options.get_undefined_funcs_auto_path(), "w", newline="\n"
+                ) as f:
+                    for symbol in undefined_funcs:
+                        f.write(f"{symbol.name} = 0x{symbol.vram_start:X};\n")
+
+        # write undefined_syms_auto.txt
+        if options.get_create_undefined_syms_auto():
+            if len(undefined_syms) > 0:
+                with open(
+                    options.get_undefined_syms_auto_path(), "w", newline="\n"
+                ) as f:
+                    for symbol in undefined_syms:
+                        f.write(f"{symbol.name} = 0x{symbol.vram_start:X};\n")
 
     # print warnings during split
     for segment in all_segments:
@@ -333,15 +416,28 @@ def main(config_path, base_dir, target_path, modes, verbose, use_cache=True):
     do_statistics(seg_sizes, rom_bytes, seg_split, seg_cached)
 
     # Save cache
-    if cache != {} and use_cache:
+    if len(cache_entries) > 0:
         if verbose:
-            log.write("Writing cache")
-        with open(options.get_cache_path(), "wb") as f4:
-            pickle.dump(cache, f4)
+            log.write(f"Writing {len(cache_entries)} cache entries")
+        for entry in cache_entries:
+            seg_cache.save_entry(entry)
+
+    if use_cache:
+        seg_cache.prune_entries(segment.unique_id() for segment in all_segments)
+
+    if profile:
+        profiler.write_report(options.get_base_path() / "splat_profile.json")
 
 
 if __name__ == "__main__":
     args = parser.parse_args()
     main(
-        args.config, args.basedir, args.target, args.modes, args.verbose, args.use_cache
+        args.config,
+        args.basedir,
+        args.target,
+        args.modes,
+        args.verbose,
+        args.use_cache,
+        args.jobs,
+        args.profile,
     )
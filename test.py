@@ -0,0 +1,82 @@
+#! /usr/bin/env python3
+
+import hashlib
+import re
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from util import synthetic
+
+SPLAT_DIR = Path(__file__).parent
+
+
+def run_split(config_path: Path, *args: str) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, str(SPLAT_DIR / "split.py"), str(config_path), *args],
+        cwd=SPLAT_DIR,
+        capture_output=True,
+        text=True,
+    )
+
+
+class TestTruncatedRom(unittest.TestCase):
+    # A data subsegment that runs past the end of the rom is split from whatever part of it is there
+    def test_data_past_end_of_rom(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            out_dir = Path(tmp)
+            config_path = synthetic.generate(
+                out_dir,
+                code_files=2,
+                funcs_per_file=2,
+                overlays=0,
+                yay0_blobs=0,
+                textures=0,
+            )
+
+            # Cut the config off after main's data and the rom off partway through a word of it
+            config = config_path.read_text()
+            data_start = int(re.search(r"- \[0x(\w+), data\]", config).group(1), 16)
+            rodata = re.search(r"      - \[0x(\w+), rodata\]", config)
+            config_path.write_text(
+                config[: rodata.start()] + f"  - [0x{rodata.group(1)}]\n"
+            )
+            rom_path = out_dir / "synthetic.z64"
+            rom_path.write_bytes(rom_path.read_bytes()[: data_start + 0x22])
+
+            result = run_split(config_path)
+            self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+            self.assertTrue((out_dir / "asm" / "data").is_dir())
+
+
+class TestCache(unittest.TestCase):
+    # A segment that's gone from the config doesn't keep its entry around
+    def test_removed_segment_is_pruned(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            out_dir = Path(tmp)
+            config_path = synthetic.generate(
+                out_dir, code_files=2, funcs_per_file=2, overlays=0, textures=0
+            )
+            cache_dir = out_dir / ".splat_cache"
+
+            def entry_path(unique_id: str) -> Path:
+                return cache_dir / hashlib.sha1(unique_id.encode()).hexdigest()
+
+            result = run_split(config_path, "--use-cache")
+            self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+            self.assertTrue(entry_path("Yay0_blob_0").is_file())
+            self.assertTrue(entry_path("Yay0_blob_1").is_file())
+
+            config = config_path.read_text()
+            config_path.write_text(re.sub(r"  - \[0x\w+, Yay0, blob_1\]\n", "", config))
+
+            result = run_split(config_path, "--use-cache")
+            self.assertEqual(result.returncode, 0, result.stdout + result.stderr)
+            self.assertTrue(entry_path("Yay0_blob_0").is_file())
+            self.assertFalse(entry_path("Yay0_blob_1").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
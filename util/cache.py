@@ -0,0 +1,401 @@
+import hashlib
+import os
+import pickle
+import tempfile
+from bisect import bisect_left
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from util import options
+from util import partition
+from util import symbols
+
+# Bump this whenever a change to splat would change the output for an unchanged segment
+CACHE_VERSION = 5
+
+# Options that only affect the global outputs (linker script, undefined_*_auto.txt, ...)
+# rather than how any individual segment is split
+GLOBAL_OPTIONS = {
+    "basename",
+    "build_path",
+    "cache_path",
+    "create_elf_section_list_auto",
+    "create_undefined_funcs_auto",
+    "create_undefined_syms_auto",
+    "elf_section_list_path",
+    "enable_ld_alignment_hack",
+    "find_file_boundaries",
+    "ld_script_path",
+    "ld_section_labels",
+    "lib_path",
+    "linker_discard_section",
+    "linker_symbol_header_path",
+    "modes",
+    "o_as_suffix",
+    "shiftable",
+    "undefined_funcs_auto_path",
+    "undefined_syms_auto_path",
+    "verbose",
+}
+
+options_digest: Optional[bytes] = None
+
+# Whether get_symbol records its lookups, which it only does while a --use-cache run scans or splits segments.
+# Splits only record the lookups that missed
+recording = False
+scanning = False
+
+# symbol_addrs entries sorted by vram and by rom, rebuilt when symbols.initialize runs again
+indexed_entries: Optional[List[symbols.GivenEntry]] = None
+entries_by_vram: List[symbols.GivenEntry] = []
+entry_vrams: List[int] = []
+entries_by_rom: List[symbols.GivenEntry] = []
+entry_roms: List[int] = []
+max_entry_size = 0
+
+# all_symbols by vram, extended as symbols get appended to it
+indexed_symbols: Optional[List[symbols.Symbol]] = None
+indexed_symbol_count = 0
+symbols_by_vram: Dict[int, List[symbols.Symbol]] = {}
+
+# What scanning a segment did to the symbols: the (before, after) state of every symbol it found and
+# the state of every symbol it created, in creation order
+ScanResult = Tuple[
+    List[Tuple[symbols.SymbolState, symbols.SymbolState]], List[symbols.SymbolState]
+]
+
+# A get_symbol call that found nothing: (address, whether it's in the segment, type, whether dead symbols count)
+Lookup = Tuple[int, bool, Optional[str], bool]
+
+
+def reset():
+    global options_digest
+    global indexed_entries
+    global indexed_symbols
+
+    options_digest = None
+    indexed_entries = None
+    indexed_symbols = None
+
+
+def dumps(obj: Any) -> bytes:
+    # Fixed protocol so keys don't change between Python versions
+    return pickle.dumps(obj, protocol=4)
+
+
+def digest(obj: Any) -> bytes:
+    return hashlib.sha1(dumps(obj)).digest()
+
+
+def get_options_digest() -> bytes:
+    global options_digest
+
+    if options_digest is None:
+        relevant = sorted(
+            (k, str(v)) for k, v in options.opts.items() if k not in GLOBAL_OPTIONS
+        )
+        options_digest = digest(relevant)
+
+    return options_digest
+
+
+def index_entries():
+    global indexed_entries
+    global entries_by_vram
+    global entry_vrams
+    global entries_by_rom
+    global entry_roms
+    global max_entry_size
+
+    if indexed_entries is symbols.given_entries:
+        return
+
+    indexed_entries = symbols.given_entries
+    entries_by_vram = sorted(indexed_entries, key=lambda e: e[0])
+    entry_vrams = [e[0] for e in entries_by_vram]
+    entries_by_rom = sorted((e for e in indexed_entries if e[2]), key=lambda e: e[2])
+    entry_roms = [e[2] for e in entries_by_rom]
+    max_entry_size = max((e[1] for e in indexed_entries), default=0)
+
+
+def entries_overlapping(vram_start: int, vram_end: int) -> List[symbols.GivenEntry]:
+    # Sized entries that start before vram_start can still reach into the range
+    lo = bisect_left(entry_vrams, vram_start - max_entry_size + 1)
+    hi = bisect_left(entry_vrams, vram_end)
+
+    return [e for e in entries_by_vram[lo:hi] if e[0] + max(e[1], 1) > vram_start]
+
+
+def entries_in_rom(rom_start: int, rom_end: int) -> List[symbols.GivenEntry]:
+    lo = bisect_left(entry_roms, rom_start)
+    hi = bisect_left(entry_roms, rom_end)
+
+    return entries_by_rom[lo:hi]
+
+
+def get_active_parts(segment) -> List[Tuple[bool, bool]]:
+    # Whether the active modes scan and split the segment and each of its subsegments. "modes" is left out of
+    # the options digest, so a segment that only got partly split under some modes doesn't look done later
+    parts = [(segment.should_scan(), segment.should_split())]
+
+    for sub in getattr(segment, "subsegments", []):
+        parts.extend(get_active_parts(sub))
+
+    return parts
+
+
+def segment_key(segment, rom_bytes, ext_refs: Iterable[int]) -> bytes:
+    """
+    Hashes everything a top-level segment's output depends on: its config entry, its bytes in the rom,
+    the options that affect segments, which of its parts the active modes split, the symbol_addrs entries
+    within its range and the entries at the external addresses it referenced
+    """
+    index_entries()
+
+    h = hashlib.sha1()
+    h.update(
+        dumps((CACHE_VERSION, segment.yaml, segment.cache(), get_active_parts(segment)))
+    )
+    h.update(get_options_digest())
+
+    if isinstance(segment.rom_start, int) and isinstance(segment.rom_end, int):
+        h.update(rom_bytes[segment.rom_start : segment.rom_end])
+        h.update(dumps(entries_in_rom(segment.rom_start, segment.rom_end)))
+
+    if segment.vram_start is not None and segment.vram_end is not None:
+        h.update(dumps(entries_overlapping(segment.vram_start, segment.vram_end)))
+
+    for addr in ext_refs:
+        h.update(dumps((addr, entries_overlapping(addr, addr + 1))))
+
+    return h.digest()
+
+
+def make_entry(segment, rom_bytes, scan: Optional[ScanResult]) -> Dict[str, Any]:
+    ext_refs = sorted(segment.ext_refs)
+
+    return {
+        "version": CACHE_VERSION,
+        "id": segment.unique_id(),
+        "key": segment_key(segment, rom_bytes, ext_refs),
+        "ext_refs": ext_refs,
+        "scan": scan,
+        # The segment's own set, so the lookups its split misses after this still make it into the entry
+        "missed": segment.missed_lookups,
+    }
+
+
+def is_hit(segment, rom_bytes, entry: Optional[Dict[str, Any]]) -> bool:
+    if entry is None:
+        return False
+
+    return entry["key"] == segment_key(segment, rom_bytes, entry["ext_refs"])
+
+
+# The cache is a directory with one file per top-level segment, so a run only reads the entries of the
+# segments it's splitting and only writes the ones that changed
+def prepare_dir() -> bool:
+    cache_dir = options.get_cache_path()
+
+    # Caches used to be a single pickle
+    if cache_dir.is_file():
+        cache_dir.unlink()
+        return False
+
+    return cache_dir.is_dir()
+
+
+def get_entry_path(unique_id: str) -> Path:
+    return options.get_cache_path() / hashlib.sha1(unique_id.encode()).hexdigest()
+
+
+def load_entry(unique_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        with get_entry_path(unique_id).open("rb") as f:
+            entry = pickle.load(f)
+    except Exception:
+        return None
+
+    if (
+        not isinstance(entry, dict)
+        or entry.get("version") != CACHE_VERSION
+        or entry.get("id") != unique_id
+    ):
+        return None
+
+    return entry
+
+
+def save_entry(entry: Dict[str, Any]):
+    path = get_entry_path(entry["id"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # Write to a temporary file and move it into place so a concurrent run never reads half an entry
+    fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=path.name, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(dumps(entry))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def prune_entries(unique_ids: Iterable[str]):
+    # Removes the entries of segments that are no longer in the config, like ones that got renamed or
+    # removed. Temporary files are left alone since they may belong to a concurrent run's save_entry
+    cache_dir = options.get_cache_path()
+    if not cache_dir.is_dir():
+        return
+
+    keep = {get_entry_path(unique_id).name for unique_id in unique_ids}
+    for path in cache_dir.iterdir():
+        if path.name not in keep and path.suffix != ".tmp" and path.is_file():
+            path.unlink(missing_ok=True)
+
+
+def record_lookup(
+    segment,
+    addr: int,
+    in_segment: bool,
+    type: Optional[str],
+    dead: bool,
+    found: Optional[symbols.Symbol],
+):
+    top = segment.get_most_parent()
+
+    if found is None:
+        top.missed_lookups.add((addr, in_segment, type, dead))
+    elif scanning and id(found) not in top.found_symbols:
+        top.found_symbols[id(found)] = (found, found.get_state())
+
+    if scanning and not in_segment:
+        top.ext_refs.add(addr)
+
+
+def begin_split():
+    global recording
+
+    recording = True
+
+
+def end_split():
+    global recording
+
+    recording = False
+
+
+def begin_scan(segment) -> Tuple[int, Dict[int, symbols.SymbolState]]:
+    global recording
+    global scanning
+
+    # The scan can change the segment's own symbols without looking them up, so note them all now
+    seg_states = {}
+    for syms in segment.seg_symbols.values():
+        for sym in syms:
+            seg_states[id(sym)] = sym.get_state()
+
+    segment.found_symbols = {}
+    recording = True
+    scanning = True
+    return len(symbols.all_symbols), seg_states
+
+
+def end_scan(segment, begin: Tuple[int, Dict[int, symbols.SymbolState]]) -> ScanResult:
+    global recording
+    global scanning
+
+    recording = False
+    scanning = False
+
+    symbol_count, seg_states = begin
+    created = symbols.all_symbols[symbol_count:]
+    created_ids = {id(sym) for sym in created}
+
+    found = []
+    for syms in segment.seg_symbols.values():
+        for sym in syms:
+            if id(sym) in seg_states:
+                found.append((seg_states[id(sym)], sym.get_state()))
+    for sym, state in segment.found_symbols.values():
+        if id(sym) not in seg_states and id(sym) not in created_ids:
+            found.append((state, sym.get_state()))
+
+    segment.found_symbols = {}
+    return found, [sym.get_state() for sym in created]
+
+
+def index_symbols():
+    global indexed_symbols
+    global indexed_symbol_count
+    global symbols_by_vram
+
+    if indexed_symbols is not symbols.all_symbols:
+        indexed_symbols = symbols.all_symbols
+        indexed_symbol_count = 0
+        symbols_by_vram = {}
+
+    for sym in indexed_symbols[indexed_symbol_count:]:
+        symbols_by_vram.setdefault(sym.vram_start, []).append(sym)
+    indexed_symbol_count = len(indexed_symbols)
+
+
+def would_find(segment, all_segments, lookup: Lookup) -> bool:
+    addr, in_segment, type, dead = lookup
+
+    # The segment only sees the symbols it owns at its own addresses and the ones it doesn't elsewhere
+    for sym in symbols_by_vram.get(addr, []):
+        if (segment in partition.get_owners(sym, all_segments)) != in_segment:
+            continue
+        if not type or sym.type == type or sym.type == "unknown":
+            return dead or not sym.dead
+
+    return False
+
+
+def restore_scan(segment, all_segments, entry: Dict[str, Any]) -> bool:
+    """
+    Applies a cached scan to the symbols, as long as they look the way they did when that scan ran and
+    nothing has appeared where its lookups found nothing. Returns False, changing nothing, when they don't
+    and the segment has to be scanned again
+    """
+    index_symbols()
+
+    for lookup in entry["missed"]:
+        if would_find(segment, all_segments, lookup):
+            return False
+
+    scan: Optional[ScanResult] = entry["scan"]
+    if scan is None:
+        return True
+
+    found, created = scan
+
+    matched: Dict[int, Tuple[symbols.Symbol, symbols.SymbolState]] = {}
+    for before, after in found:
+        for sym in symbols_by_vram.get(before[0], []):
+            if id(sym) not in matched and sym.get_state() == before:
+                matched[id(sym)] = (sym, after)
+                break
+        else:
+            return False
+
+    # If something else made one of these symbols since, the scan would have used it instead
+    for state in created:
+        for sym in symbols_by_vram.get(state[0], []):
+            if (
+                sym.rom == state[1]
+                and not sym.dead
+                and (sym.type == state[3] or "unknown" in (sym.type, state[3]))
+            ):
+                return False
+
+    for sym, after in matched.values():
+        sym.set_state(after)
+
+    for state in created:
+        sym = symbols.Symbol(state[0])
+        sym.set_state(state)
+        symbols.all_symbols.append(sym)
+
+    return True
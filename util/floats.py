@@ -1,7 +1,16 @@
+from functools import lru_cache
 import math
 import struct
 
+# Float tables tend to repeat the same few constants, so formatted values are remembered by their bits
+FORMAT_CACHE_SIZE = 4096
+
+# Any float formatted with 9 significant digits or more parses back to the same float
+F32_ROUND_TRIP_DIGITS = 9
+
+
 # From mips_to_c: https://github.com/matt-kempster/mips_to_c/blob/d208400cca045113dada3e16c0d59c50cdac4529/src/translate.py#L2085
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
 def format_f32_imm(num: int) -> str:
     packed = struct.pack(">I", num & (2**32 - 1))
     value = struct.unpack(">f", packed)[0]
@@ -12,12 +21,16 @@ def format_f32_imm(num: int) -> str:
 
     # Write values smaller than 1e-7 / greater than 1e7 using scientific notation,
     # and values in between using fixed point.
-    if abs(math.log10(abs(value))) > 6.9:
+    log = math.log10(abs(value))
+    if abs(log) > 6.9:
         fmt_char = "e"
+        round_trip_prec = F32_ROUND_TRIP_DIGITS - 1
     elif abs(value) < 1:
         fmt_char = "f"
+        round_trip_prec = F32_ROUND_TRIP_DIGITS + math.floor(-log)
     else:
         fmt_char = "g"
+        round_trip_prec = F32_ROUND_TRIP_DIGITS
 
     def fmt(prec: int) -> str:
         """Format 'value' with 'prec' significant digits/decimals, in either scientific
@@ -37,8 +50,12 @@ def format_f32_imm(num: int) -> str:
             return "0"
         return ret
 
-    # 20 decimals is more than enough for a float. Start there, then try to shrink it.
-    prec = 20
+    # Every precision from the one that's enough for any float up to 20 round-trips too, so start there (or at 20,
+    # which is more than enough for a float) then try to shrink it.
+    if struct.pack(">f", float(fmt(round_trip_prec))) == packed:
+        prec = round_trip_prec
+    else:
+        prec = 20
     while prec > 0:
         prec -= 1
         value2 = float(fmt(prec))
@@ -57,6 +74,7 @@ def format_f32_imm(num: int) -> str:
     return ret
 
 
+@lru_cache(maxsize=FORMAT_CACHE_SIZE)
 def format_f64_imm(num: int) -> str:
     (value,) = struct.unpack(">d", struct.pack(">Q", num & (2**64 - 1)))
     return str(value)
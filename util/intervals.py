@@ -0,0 +1,73 @@
+from bisect import bisect_right
+from typing import Dict, Generic, Iterable, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class IntervalIndex(Generic[T]):
+    """
+    Finds every half-open interval [start, end) containing a point. The number line is cut into
+    elementary intervals at each start and end, and each of those holds the items covering it in
+    the order they were given, so a lookup is a single bisect
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[int, int, T]]):
+        starts: Dict[int, List[Tuple[int, T]]] = {}
+        ends: Dict[int, List[int]] = {}
+
+        for order, (start, end, item) in enumerate(intervals):
+            if start < end:
+                starts.setdefault(start, []).append((order, item))
+                ends.setdefault(end, []).append(order)
+
+        self.bounds: List[int] = sorted(starts.keys() | ends.keys())
+        self.covers: List[Tuple[T, ...]] = []
+
+        active: Dict[int, T] = {}
+        for point in self.bounds:
+            for order in ends.get(point, []):
+                del active[order]
+            for order, item in starts.get(point, []):
+                active[order] = item
+
+            self.covers.append(tuple(active[order] for order in sorted(active)))
+
+    def find(self, point: int) -> Tuple[T, ...]:
+        i = bisect_right(self.bounds, point) - 1
+
+        if i < 0:
+            return ()
+        return self.covers[i]
+
+
+class OverlapIndex:
+    """
+    Finds whether a point is covered by at least min_depth of the given half-open intervals, by default
+    whether two or more overlap there. One sweep over the starts and ends finds the regions that deep, so a
+    lookup is a single bisect
+    """
+
+    def __init__(self, intervals: Iterable[Tuple[int, int]], min_depth: int = 2):
+        deltas: Dict[int, int] = {}
+
+        for start, end in intervals:
+            if start < end:
+                deltas[start] = deltas.get(start, 0) + 1
+                deltas[end] = deltas.get(end, 0) - 1
+
+        self.starts: List[int] = []
+        self.ends: List[int] = []
+
+        depth = 0
+        for point in sorted(deltas):
+            depth += deltas[point]
+
+            if depth >= min_depth and len(self.starts) == len(self.ends):
+                self.starts.append(point)
+            elif depth < min_depth and len(self.starts) > len(self.ends):
+                self.ends.append(point)
+
+    def contains(self, point: int) -> bool:
+        i = bisect_right(self.starts, point) - 1
+
+        return i >= 0 and point < self.ends[i]
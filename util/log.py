@@ -1,6 +1,6 @@
 import sys
 from colorama import init, Fore, Style
-from typing import Optional
+from typing import NoReturn, Optional
 
 init(autoreset=True)
 
@@ -19,7 +19,7 @@ def write(*args, status=None, **kwargs):
     print(status_to_ansi(status) + str(args[0]), *args[1:], **kwargs)
 
 
-def error(*args, **kwargs):
+def error(*args, **kwargs) -> NoReturn:
     write(*args, **kwargs, status="error")
     sys.exit(2)
 
@@ -0,0 +1,115 @@
+from types import ModuleType
+from typing import List, Optional, Tuple
+
+from util import log
+
+# numpy is optional; without it, callers fall back to looking at every instruction
+np: Optional[ModuleType]
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+warned_no_numpy = False
+
+
+# Called by the callers' fallbacks. Says once that numpy is missing, since everything still works, just slower
+def warn_no_numpy():
+    global warned_no_numpy
+
+    if not warned_no_numpy:
+        log.write(
+            "numpy is not installed, splitting will be slower (pip3 install numpy)",
+            status="warn",
+        )
+        warned_no_numpy = True
+
+
+# Reads the fields splat cares about straight out of a MIPS instruction word, so finding symbols doesn't
+# have to parse capstone's text. Capstone is still what names the instruction and renders it for output
+
+OP_J = 0x02
+OP_JAL = 0x03
+OP_LUI = 0x0F
+OP_MSA = 0x1E
+
+# Loads, stores, cache and pref all live at and above this opcode, and all address memory as offset(base)
+OP_FIRST_LOAD_STORE = 0x20
+
+REG_GP = 28
+
+# The opcodes of every instruction capstone names a branch that really is one, with a target as its last operand.
+# The SPECIAL2, MSA and SPECIAL3 instructions whose mnemonics just happen to start with b (baddu, bclri.w,
+# balign, ...) take an immediate or a register there instead
+BRANCH_OPCODES = [0x01, 0x02, *range(0x04, 0x08), *range(0x10, 0x18)]
+BRANCH_OPCODES += [0x32, 0x36, 0x3A, 0x3E]
+
+
+def get_opcode(word: int) -> int:
+    return word >> 26
+
+
+def get_rs(word: int) -> int:
+    return (word >> 21) & 0x1F
+
+
+def get_rt(word: int) -> int:
+    return (word >> 16) & 0x1F
+
+
+def get_rd(word: int) -> int:
+    return (word >> 11) & 0x1F
+
+
+def get_funct(word: int) -> int:
+    return word & 0x3F
+
+
+def get_imm(word: int) -> int:
+    return word & 0xFFFF
+
+
+def get_simm(word: int) -> int:
+    imm = word & 0xFFFF
+    return imm - 0x10000 if imm & 0x8000 else imm
+
+
+def is_load_store(word: int) -> bool:
+    return word >> 26 >= OP_FIRST_LOAD_STORE
+
+
+def is_branch(word: int) -> bool:
+    return word >> 26 in BRANCH_OPCODES
+
+
+def get_target(word: int, address: int) -> int:
+    # j and jal replace the low 28 bits of the address, every other branch is relative to its delay slot
+    if word >> 26 in (OP_J, OP_JAL):
+        return ((address + 4) & 0xF0000000) | ((word & 0x3FFFFFF) << 2)
+    return address + 4 + (get_simm(word) << 2)
+
+
+def find_candidates(
+    code: bytes, endianness: str
+) -> Optional[Tuple[List[int], List[int]]]:
+    # Looks at every word of code at once for the few that need a closer look: the ones that could be branches,
+    # and the ones that could start a %hi/%lo pair (a lui of 0x8000 or above) or be a %gp_rel access. Returns
+    # their word indices, or None without numpy, in which case every instruction has to be looked at
+    if np is None:
+        warn_no_numpy()
+        return None
+
+    words = np.frombuffer(
+        code, dtype=">u4" if endianness == "big" else "<u4", count=len(code) // 4
+    )
+    opcodes = words >> 26
+
+    branches = np.isin(opcodes, BRANCH_OPCODES)
+    # MSA loads and stores keep their base register somewhere other than rs
+    his = (
+        ((opcodes == OP_LUI) & ((words & 0xFFFF) >= 0x8000))
+        | (((words >> 21) & 0x1F) == REG_GP)
+        | (opcodes == OP_MSA)
+    )
+
+    return np.flatnonzero(branches).tolist(), np.flatnonzero(his).tolist()
@@ -147,7 +147,7 @@ def get_nonmatchings_path() -> Path:
     return get_asm_path() / "nonmatchings"
 
 
-# Determines the path to the cache file (used when supplied --use-cache via the CLI)
+# Determines the path to the cache directory (used when supplied --use-cache via the CLI)
 def get_cache_path() -> Path:
     return get_base_path() / opts.get("cache_path", ".splat_cache")
 
@@ -0,0 +1,115 @@
+from typing import Dict, List, Set, Tuple, TYPE_CHECKING
+
+from util import symbols
+from util.intervals import IntervalIndex
+from util.symbols import Symbol
+
+# circular import
+if TYPE_CHECKING:
+    from segtypes.segment import Segment
+
+# Sorts all_symbols into the top-level segments that own them once, rather than walking every symbol for
+# every segment. A symbol is owned by the segment containing its rom address, or, when it has no rom
+# address and only one segment contains its vram, by that segment
+
+segments_by_vram: "IntervalIndex[Segment]" = IntervalIndex([])
+segments_by_rom: "IntervalIndex[Segment]" = IntervalIndex([])
+
+# The symbols each segment owns, by vram, until they're handed to the segment
+buckets: "Dict[Segment, Dict[int, List[Symbol]]]" = {}
+handed_out: "Set[Segment]" = set()
+
+# Every partitioned symbol by vram, with its position in all_symbols and its owners
+symbols_by_vram: "Dict[int, List[Tuple[int, Symbol, Tuple[Segment, ...]]]]" = {}
+partitioned_symbols: List[Symbol] = []
+partitioned_count = 0
+
+
+def initialize(all_segments: "List[Segment]"):
+    global segments_by_vram
+    global segments_by_rom
+    global buckets
+    global handed_out
+    global symbols_by_vram
+    global partitioned_symbols
+    global partitioned_count
+
+    segments_by_vram = IntervalIndex(
+        (s.vram_start, s.vram_end, s)
+        for s in all_segments
+        if s.vram_start is not None and s.vram_end is not None
+    )
+    segments_by_rom = IntervalIndex(
+        (s.rom_start, s.rom_end, s)
+        for s in all_segments
+        if isinstance(s.rom_start, int) and isinstance(s.rom_end, int)
+    )
+
+    buckets = {}
+    handed_out = set()
+    symbols_by_vram = {}
+    partitioned_symbols = symbols.all_symbols
+    partitioned_count = 0
+
+
+def get_owners(symbol: Symbol, all_segments: "List[Segment]") -> "Tuple[Segment, ...]":
+    if symbols.is_symbol_isolated(symbol, all_segments) and not symbol.rom:
+        return segments_by_vram.find(symbol.vram_start)
+    elif symbol.rom:
+        return segments_by_rom.find(symbol.rom)
+    else:
+        return ()
+
+
+def update(all_segments: "List[Segment]"):
+    global partitioned_symbols
+    global partitioned_count
+
+    if partitioned_symbols is not symbols.all_symbols:
+        initialize(all_segments)
+
+    for pos in range(partitioned_count, len(partitioned_symbols)):
+        symbol = partitioned_symbols[pos]
+        owners = get_owners(symbol, all_segments)
+
+        symbols_by_vram.setdefault(symbol.vram_start, []).append((pos, symbol, owners))
+
+        # Segments that were already handed their symbols add the ones they create themselves
+        for owner in owners:
+            if owner not in handed_out:
+                bucket = buckets.setdefault(owner, {})
+                bucket.setdefault(symbol.vram_start, []).append(symbol)
+
+    partitioned_count = len(partitioned_symbols)
+
+
+class ExtSymbols(Dict[int, List[Symbol]]):
+    """
+    A segment's given_ext_symbols: the symbols that existed when it was handed its symbols and that it
+    doesn't own. Each vram's list is filled in the first time it's looked up
+    """
+
+    def __init__(self, segment: "Segment", count: int):
+        super().__init__()
+        self.segment = segment
+        self.count = count
+
+    def __missing__(self, vram: int) -> List[Symbol]:
+        syms = [
+            symbol
+            for pos, symbol, owners in symbols_by_vram.get(vram, [])
+            if pos < self.count and self.segment not in owners
+        ]
+        self[vram] = syms
+        return syms
+
+    def __contains__(self, vram) -> bool:
+        return len(self[vram]) > 0
+
+
+def assign(segment: "Segment", all_segments: "List[Segment]"):
+    update(all_segments)
+
+    segment.given_seg_symbols = buckets.pop(segment, {})
+    segment.given_ext_symbols = ExtSymbols(segment, partitioned_count)
+    handed_out.add(segment)
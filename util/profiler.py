@@ -0,0 +1,103 @@
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from util import log
+
+# Records wall time, cpu time and peak allocation for each phase of a run and each segment's scan and
+# split (used when supplied --profile via the CLI)
+
+enabled = False
+phases: List[Dict[str, Any]] = []
+segments: List[Dict[str, Any]] = []
+
+# Peak traced memory seen by each measurement that's still running, so nested measurements can reset
+# the peak without losing the outer one's
+peak_stack: List[int] = []
+
+
+def start():
+    global enabled
+    global phases
+    global segments
+    global peak_stack
+
+    enabled = True
+    phases = []
+    segments = []
+    peak_stack = []
+
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def update_peaks():
+    peak = tracemalloc.get_traced_memory()[1]
+
+    for i in range(len(peak_stack)):
+        peak_stack[i] = max(peak_stack[i], peak)
+
+
+@contextmanager
+def measure(phase: str, segment=None):
+    if not enabled:
+        yield None
+        return
+
+    record: Dict[str, Any] = {"phase": phase}
+    if segment is not None:
+        record["segment"] = segment.unique_id()
+        record["type"] = segment.type
+
+    update_peaks()
+    tracemalloc.reset_peak()
+    start_mem = tracemalloc.get_traced_memory()[0]
+    peak_stack.append(start_mem)
+
+    start_wall = time.perf_counter()
+    start_cpu = time.process_time()
+
+    try:
+        yield record
+    finally:
+        record["wall"] = time.perf_counter() - start_wall
+        record["cpu"] = time.process_time() - start_cpu
+
+        update_peaks()
+        record["peak"] = peak_stack.pop() - start_mem
+
+        add(record)
+
+
+def add(record: Optional[Dict[str, Any]]):
+    if record is None:
+        return
+
+    if "segment" in record:
+        segments.append(record)
+    else:
+        phases.append(record)
+
+
+def fmt_row(name: str, phase: str, record: Dict[str, Any]) -> str:
+    return f"{name:<40} {phase:>6} {record['wall'] * 1000:>10.1f} {record['cpu'] * 1000:>10.1f} {record['peak'] // 1024:>10}"
+
+
+def write_report(path, top: int = 20):
+    with open(path, "w", newline="\n") as f:
+        json.dump({"phases": phases, "segments": segments}, f, indent=2)
+
+    log.write(f"{'phase':<40} {'':>6} {'wall ms':>10} {'cpu ms':>10} {'peak KB':>10}")
+    for record in phases:
+        log.write(fmt_row(record["phase"], "", record))
+
+    log.write("")
+    log.write(
+        f"{'segment':<40} {'phase':>6} {'wall ms':>10} {'cpu ms':>10} {'peak KB':>10}"
+    )
+    for record in sorted(segments, key=lambda r: r["wall"], reverse=True)[:top]:
+        log.write(fmt_row(record["segment"], record["phase"], record))
+
+    log.write(f"Wrote profile to {path}")
@@ -0,0 +1,138 @@
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+import re
+from typing import List, Tuple
+
+# Decides whether some data looks like a string. Decoded as EUC-JP, it has to be more than 4 characters long,
+# may only have nulls at the end (and no more than 16 of them), may not repeat a non-null character more than 10
+# times in a row or contain any of INVALID_CHARS, and at least 3/4 of the characters before the nulls have to be
+# in VALID_CHARS
+
+VALID_CHARS = (
+    "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ1234567890[]():%!#=-_ "
+)
+INVALID_CHARS = "\x02\x1c\x04\x14"
+DUPLICATE_LIMIT = 10
+MAX_TRAILING_NULLS = 16
+MIN_VALID_RATIO = 0.75
+
+INVALID_CHAR_RE = re.compile(f"[^{re.escape(VALID_CHARS)}]")
+INVALID_RE = re.compile(f"[{INVALID_CHARS}]")
+REPEAT_RE = re.compile(f"([^\\x00])\\1{{{DUPLICATE_LIMIT},}}")
+
+# The same rules over raw bytes, for data that's pure ASCII and so decodes to exactly its bytes
+VALID_TABLE = bytes(1 if chr(b) in VALID_CHARS else 0 for b in range(256))
+INVALID_BYTES_RE = re.compile(INVALID_RE.pattern.encode())
+REPEAT_BYTES_RE = re.compile(REPEAT_RE.pattern.encode(), re.DOTALL)
+NULLS_RE = re.compile(b"\x00+")
+NON_ASCII_RE = re.compile(b"[\x80-\xff]+")
+
+
+def is_valid_ascii(data) -> bool:
+    if len(data) <= 4 or data[0] == 0:
+        return False
+
+    try:
+        chars = str(data, "EUC-JP")
+    except:
+        return False
+
+    if len(chars) <= 4:
+        return False
+
+    if INVALID_RE.search(chars):
+        return False
+
+    # TODO: if we find null bytes in the middle, break this into multiple strings ?
+    text = chars.rstrip("\x00")
+
+    # If there are more than 16 null chars at the end, something is afoot
+    if len(chars) - len(text) > MAX_TRAILING_NULLS:
+        return False
+
+    # Ensure we're not seeing a ton of the same character in a row
+    if REPEAT_RE.search(text):
+        return False
+
+    valid_count = len(text) - len(INVALID_CHAR_RE.findall(text))
+    return valid_count / len(text) >= MIN_VALID_RATIO
+
+
+def find_runs(pattern: "re.Pattern[bytes]", data: bytes) -> Tuple[List[int], List[int]]:
+    starts: List[int] = []
+    ends: List[int] = []
+
+    for match in pattern.finditer(data):
+        starts.append(match.start())
+        ends.append(match.end())
+
+    return starts, ends
+
+
+class StringClassifier:
+    """
+    Answers is_valid_ascii for any span of rom_bytes[start:end], usually a whole data segment. The segment is
+    classified once up front: a running count of valid characters, and where its nulls, repeated characters and
+    non-ASCII bytes are. A span of pure ASCII is judged from those without decoding it, anything else is decoded
+    like before
+    """
+
+    def __init__(self, rom_bytes, start: int, end: int):
+        data = bytes(rom_bytes[start:end])
+
+        # Spans past the end of the rom are left to is_valid_ascii, like spans outside of start:end
+        self.rom_bytes = rom_bytes
+        self.start = start
+        self.end = start + len(data)
+        self.data = data
+        self.valid_counts = array(
+            "I", accumulate(data.translate(VALID_TABLE), initial=0)
+        )
+        self.nulls = find_runs(NULLS_RE, data)
+        self.invalid = find_runs(INVALID_BYTES_RE, data)
+        self.repeats = find_runs(REPEAT_BYTES_RE, data)
+        self.non_ascii = find_runs(NON_ASCII_RE, data)
+
+    @staticmethod
+    def overlapping(runs: Tuple[List[int], List[int]], start: int, end: int):
+        starts, ends = runs
+
+        for i in range(bisect_right(ends, start), len(starts)):
+            if starts[i] >= end:
+                break
+            yield max(starts[i], start), min(ends[i], end)
+
+    def is_valid_ascii(self, start: int, end: int) -> bool:
+        if start < self.start or end > self.end:
+            return is_valid_ascii(self.rom_bytes[start:end])
+
+        start -= self.start
+        end -= self.start
+
+        if end - start <= 4 or self.data[start] == 0:
+            return False
+
+        # Anything else has to be decoded to be judged
+        if any(self.overlapping(self.non_ascii, start, end)):
+            return is_valid_ascii(self.data[start:end])
+
+        if any(self.overlapping(self.invalid, start, end)):
+            return False
+
+        text_end = end
+        if self.data[end - 1] == 0:
+            null_starts = self.nulls[0]
+            text_end = null_starts[bisect_right(null_starts, end - 1) - 1]
+
+            # If there are more than 16 null chars at the end, something is afoot
+            if end - text_end > MAX_TRAILING_NULLS:
+                return False
+
+        # Ensure we're not seeing a ton of the same character in a row
+        for run_start, run_end in self.overlapping(self.repeats, start, end):
+            if run_end - run_start > DUPLICATE_LIMIT:
+                return False
+
+        valid_count = self.valid_counts[text_end] - self.valid_counts[start]
+        return valid_count / (text_end - start) >= MIN_VALID_RATIO
@@ -1,13 +1,36 @@
-from dataclasses import dataclass
-from typing import Dict, List, Optional
+import sys
+from typing import Dict, List, Optional, Tuple
 
-from capstone import CsInsn
 from util import options, log
+from util.intervals import IntervalIndex, OverlapIndex
 
 all_symbols: "List[Symbol]" = []
 symbol_ranges: "List[Symbol]" = []
 sym_isolated_map: "Dict[Symbol, bool]" = {}
 
+# Where the vram ranges of two or more of the segments overlap (overlays), for is_symbol_isolated
+overlaps_segments: "Optional[List]" = None
+overlaps = OverlapIndex([])
+
+# symbol_ranges by vram, rebuilt when a symbol gets added to it or one of its symbols changes size
+ranges_index: "Optional[IntervalIndex[Symbol]]" = None
+ranges_indexed_count = 0
+
+# Bumped whenever a func changes size or a restore changes a symbol's type or size, so func indexes rebuild
+funcs_version = 0
+
+# Bumped whenever an existing symbol's name can have changed, so indexes of names know to rebuild
+names_version = 0
+
+# (vram, size, rom, name, type, dead, defined, extract) of each symbol_addrs entry as it was parsed
+GivenEntry = Tuple[int, int, Optional[int], str, str, bool, bool, bool]
+given_entries: List[GivenEntry] = []
+
+# (vram, rom, given_name, type, size, in_overlay, dead, extract, defined, referenced, access_mnemonic)
+SymbolState = Tuple[
+    int, Optional[int], str, str, int, bool, bool, bool, bool, bool, Optional[str]
+]
+
 TRUEY_VALS = ["true", "on", "yes", "y"]
 FALSEY_VALS = ["false", "off", "no", "n"]
 
@@ -23,9 +46,14 @@ def is_falsey(str: str) -> bool:
 def initialize(all_segments):
     global all_symbols
     global symbol_ranges
+    global given_entries
+    global sym_isolated_map
 
     all_symbols = []
     symbol_ranges = []
+    given_entries = []
+    sym_isolated_map = {}
+    invalidate_ranges()
 
     # Manual list of func name / addrs
     for path in options.get_symbol_addrs_paths():
@@ -126,64 +154,163 @@ def initialize(all_segments):
                                         sym.extract = tf_val
                                         continue
                         all_symbols.append(sym)
+                        given_entries.append(
+                            (
+                                sym.vram_start,
+                                sym.size,
+                                sym.rom,
+                                sym.given_name,
+                                sym.type,
+                                sym.dead,
+                                sym.defined,
+                                sym.extract,
+                            )
+                        )
 
                         # Symbol ranges
                         if sym.size > 4:
                             symbol_ranges.append(sym)
+                            sym.in_ranges = True
 
                         is_symbol_isolated(sym, all_segments)
 
 
 def is_symbol_isolated(symbol, all_segments):
+    global overlaps_segments
+    global overlaps
+
     if symbol in sym_isolated_map:
         return sym_isolated_map[symbol]
 
-    relevant_segs = 0
-
-    for segment in all_segments:
-        if segment.contains_vram(symbol.vram_start):
-            relevant_segs += 1
-            if relevant_segs > 1:
-                break
+    if overlaps_segments is not all_segments:
+        overlaps_segments = all_segments
+        overlaps = OverlapIndex(
+            (s.vram_start, s.vram_end)
+            for s in all_segments
+            if s.vram_start is not None and s.vram_end is not None
+        )
 
-    sym_isolated_map[symbol] = relevant_segs < 2
+    sym_isolated_map[symbol] = not overlaps.contains(symbol.vram_start)
     return sym_isolated_map[symbol]
 
 
-def retrieve_from_ranges(vram, rom=None):
-    rom_matches = []
-    ram_matches = []
+def get_undefined() -> "Tuple[List[Symbol], List[Symbol]]":
+    # The symbols that were referenced but never defined, split into (funcs, everything else) in one pass
+    funcs: List[Symbol] = []
+    syms: List[Symbol] = []
 
-    for symbol in symbol_ranges:
-        if symbol.contains_vram(vram):
-            if symbol.rom and rom and symbol.contains_rom(rom):
-                rom_matches.append(symbol)
+    for symbol in all_symbols:
+        if symbol.referenced and not symbol.defined and not symbol.dead:
+            if symbol.type == "func":
+                funcs.append(symbol)
             else:
-                ram_matches.append(symbol)
+                syms.append(symbol)
+
+    return funcs, syms
+
+
+def invalidate_ranges():
+    global ranges_index
+
+    ranges_index = None
+
+
+def invalidate_names():
+    global names_version
+
+    names_version += 1
 
-    ret = rom_matches + ram_matches
 
-    if len(ret) > 0:
-        return ret[0]
-    else:
+def retrieve_from_ranges(vram, rom=None):
+    global ranges_index
+    global ranges_indexed_count
+
+    if ranges_index is None or ranges_indexed_count != len(symbol_ranges):
+        ranges_index = IntervalIndex(
+            (s.vram_start, s.vram_end, s) for s in symbol_ranges
+        )
+        ranges_indexed_count = len(symbol_ranges)
+
+    matches = ranges_index.find(vram)
+
+    if len(matches) == 0:
         return None
 
+    # Prefer the first symbol whose rom range also matches, otherwise take the first one
+    if rom:
+        for symbol in matches:
+            if symbol.rom and symbol.contains_rom(rom):
+                return symbol
+
+    return matches[0]
+
 
-@dataclass
 class Instruction:
-    instruction: CsInsn
-    mnemonic: str
-    op_str: str
-    rom_addr: int
-    is_gp: bool = False
-    is_hi: bool = False
-    is_lo: bool = False
-    hi_lo_sym: Optional["Symbol"] = None
-    sym_offset_str: str = ""
-    hi_lo_reg: str = ""
+    # One of these is kept for every word of code, so it only holds the word itself and what's needed to
+    # write it out. Mnemonics are interned so every instruction shares the same few strings
+    __slots__ = (
+        "word",
+        "address",
+        "raw_mnemonic",
+        "raw_op_str",
+        "mnemonic",
+        "op_str",
+        "rom_addr",
+        "is_gp",
+        "is_hi",
+        "is_lo",
+        "hi_lo_sym",
+        "sym_offset_str",
+        "hi_lo_reg",
+    )
+
+    def __init__(
+        self,
+        word: int,
+        address: int,
+        raw_mnemonic: str,
+        raw_op_str: str,
+        mnemonic: str,
+        op_str: str,
+        rom_addr: int,
+    ):
+        self.word = word
+        self.address = address
+        # As disassembled, before any of splat's changes to mnemonic and op_str
+        self.raw_mnemonic = sys.intern(raw_mnemonic)
+        self.raw_op_str = raw_op_str
+        self.mnemonic = sys.intern(mnemonic)
+        self.op_str = op_str
+        self.rom_addr = rom_addr
+        self.is_gp = False
+        self.is_hi = False
+        self.is_lo = False
+        self.hi_lo_sym: Optional["Symbol"] = None
+        self.sym_offset_str = ""
+        self.hi_lo_reg = ""
 
 
 class Symbol:
+    __slots__ = (
+        "defined",
+        "referenced",
+        "vram_start",
+        "rom",
+        "type",
+        "in_overlay",
+        "in_ranges",
+        "_size",
+        "given_name",
+        "insns",
+        "access_mnemonic",
+        "disasm_str",
+        "dead",
+        "extract",
+    )
+
+    # What the size property stores, declared here since the property comes before __init__
+    _size: int
+
     @property
     def default_name(self) -> str:
         suffix = f"_{self.vram_start:X}"
@@ -200,6 +327,21 @@ class Symbol:
 
         return prefix + suffix
 
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @size.setter
+    def size(self, size: int):
+        global funcs_version
+
+        if size != self._size:
+            if self.in_ranges:
+                invalidate_ranges()
+            if self.type == "func":
+                funcs_version += 1
+        self._size = size
+
     @property
     def rom_end(self):
         return None if not self.rom else self.rom + self.size
@@ -233,10 +375,52 @@ class Symbol:
         self.rom = rom
         self.type = type
         self.in_overlay = in_overlay
-        self.size = size
+        self.in_ranges = False
+        self._size = size
         self.given_name: str = given_name
         self.insns: List[Instruction] = []
-        self.access_mnemonic = None
+        self.access_mnemonic: Optional[str] = None
         self.disasm_str = None
         self.dead = False
         self.extract = True
+
+    # Everything about a symbol that scanning a segment can change
+    def get_state(self) -> SymbolState:
+        return (
+            self.vram_start,
+            self.rom,
+            self.given_name,
+            self.type,
+            self.size,
+            self.in_overlay,
+            self.dead,
+            self.extract,
+            self.defined,
+            self.referenced,
+            self.access_mnemonic,
+        )
+
+    def set_state(self, state: SymbolState):
+        global funcs_version
+
+        old_type, old_size, old_name = self.type, self.size, self.name
+
+        (
+            self.vram_start,
+            self.rom,
+            self.given_name,
+            self.type,
+            self.size,
+            self.in_overlay,
+            self.dead,
+            self.extract,
+            self.defined,
+            self.referenced,
+            self.access_mnemonic,
+        ) = state
+
+        # Indexes of funcs and names only need to rebuild when what they're built from changed
+        if self.type != old_type or self.size != old_size:
+            funcs_version += 1
+        if self.name != old_name:
+            invalidate_names()
@@ -0,0 +1,525 @@
+"""
+Synthetic ROM generator
+
+Builds a big-endian N64-style ROM containing MIPS code (with calls, loops, %hi/%lo pairs,
+$gp accesses and switch jump tables), data, rodata, Yay0 blobs and textures, along with a
+matching splat config and symbol_addrs.txt. Used by bench.py to time splat on inputs of a
+configurable size without needing a real game.
+"""
+
+import argparse
+import random
+import struct
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+# Registers
+ZERO = 0
+AT = 1
+V0 = 2
+A0 = 4
+T6 = 14
+T7 = 15
+GP = 28
+SP = 29
+RA = 31
+
+HEADER_SIZE = 0x40
+BOOT_END = 0x1000
+MAIN_VRAM = 0x80000400
+OVERLAY_VRAM = 0x80200000
+GP_VALUE = 0x800F8000
+
+STRINGS = [
+    "Hello, world!\n",
+    "Player %d wins\n",
+    "ERROR: out of memory (%d)\n",
+    "THE QUICK BROWN FOX JUMPS OVER THE LAZY DOG",
+    "assets/models/mario.bin",
+    "Press START",
+]
+
+# Texture formats and their bytes per pixel, in the order textures cycle through them
+TEXTURE_FORMATS = {
+    "rgba16": 2,
+    "i4": 0.5,
+    "ia8": 1,
+    "ci8": 1,
+    "ci4": 0.5,
+    "i8": 1,
+    "ia4": 0.5,
+    "ia16": 2,
+    "rgba32": 4,
+}
+PALETTE_SIZES = {"ci8": 0x200, "ci4": 0x20}
+
+FLOATS = [0.5, 1.0, 2.0, 3.1415927, 0.1, 100.0, -1.0, 0.0174533, 60.0, 1.5e-5]
+DOUBLES = [0.5, 3.141592653589793, 1e-3, 2.0]
+
+
+def op_i(op: int, rs: int, rt: int, imm: int) -> int:
+    return (op << 26) | (rs << 21) | (rt << 16) | (imm & 0xFFFF)
+
+
+def op_r(rs: int, rt: int, rd: int, sa: int, funct: int) -> int:
+    return (rs << 21) | (rt << 16) | (rd << 11) | (sa << 6) | funct
+
+
+def op_j(op: int, target: int) -> int:
+    return (op << 26) | ((target >> 2) & 0x3FFFFFF)
+
+
+def hi(addr: int) -> int:
+    return ((addr + 0x8000) >> 16) & 0xFFFF
+
+
+def lo(addr: int) -> int:
+    return addr & 0xFFFF
+
+
+def align(value: int, n: int) -> int:
+    return (value + n - 1) // n * n
+
+
+class CodeGroup:
+    """A code segment: code subsegments, then data and rodata"""
+
+    def __init__(
+        self,
+        rng: random.Random,
+        name: str,
+        vram: int,
+        num_files: int,
+        funcs_per_file: int,
+        ext_funcs: List[int],
+    ):
+        self.rng = rng
+        self.name = name
+        self.vram = vram
+        self.ext_funcs = ext_funcs
+
+        # Plan the code first so we know how big it is
+        self.file_plans: List[List[List[str]]] = []
+        for _ in range(num_files):
+            self.file_plans.append(
+                [self.plan_function() for _ in range(funcs_per_file)]
+            )
+
+        self.code_size = sum(
+            self.block_len(block, plan)
+            for file_plan in self.file_plans
+            for plan in file_plan
+            for block in plan
+        )
+
+        self.data_vram = vram + self.code_size
+        self.data = bytearray()
+        self.data_syms: List[Tuple[int, int]] = []  # (vram, size)
+        self.rodata = bytearray()
+        self.strings: List[int] = []
+        self.floats: List[int] = []
+        self.doubles: List[int] = []
+        self.jtbls: List[int] = []
+
+        self.layout_data()
+
+    def plan_function(self) -> List[str]:
+        blocks = ["prologue"]
+        for _ in range(self.rng.randint(1, 6)):
+            blocks.append(
+                self.rng.choice(
+                    ["addr", "load", "store", "call", "loop", "float", "double", "gp"]
+                )
+            )
+        if self.rng.random() < 0.25:
+            blocks.append("switch")
+        blocks.append("epilogue")
+        return blocks
+
+    @staticmethod
+    def block_len(block: str, plan: List[str]) -> int:
+        lens = {
+            "prologue": 2,
+            "epilogue": 3,
+            "addr": 2,
+            "load": 2,
+            "store": 2,
+            "call": 2,
+            "loop": 3,
+            "float": 2,
+            "double": 2,
+            "gp": 1,
+            "switch": 8 + 3 * 5 + 1,
+        }
+        return lens[block] * 4
+
+    def layout_data(self):
+        rng = self.rng
+
+        # .data: some words, pointers and strings
+        for _ in range(max(4, self.code_size // 64)):
+            kind = rng.choice(["word", "ptr", "string", "array"])
+            start = self.data_vram + len(self.data)
+            if kind == "word":
+                self.data += struct.pack(">I", rng.getrandbits(16))
+            elif kind == "ptr":
+                target = rng.choice(self.data_syms)[0] if self.data_syms else start
+                self.data += struct.pack(">I", target)
+            elif kind == "string":
+                s = rng.choice(STRINGS).encode("ascii") + b"\0"
+                self.data += s + b"\0" * (align(len(s), 4) - len(s))
+                self.strings.append(start)
+            else:
+                for _ in range(rng.randint(2, 16)):
+                    self.data += struct.pack(">H", rng.getrandbits(12))
+                self.data += b"\0" * (align(len(self.data), 4) - len(self.data))
+            self.data_syms.append((start, self.data_vram + len(self.data) - start))
+
+        self.rodata_vram = self.data_vram + len(self.data)
+
+        # .rodata: jump tables get filled in once the code is laid out
+        for file_plan in self.file_plans:
+            for plan in file_plan:
+                if "switch" in plan:
+                    self.jtbls.append(self.rodata_vram + len(self.rodata))
+                    self.rodata += b"\0" * 4 * 5
+
+        for _ in range(max(2, len(self.file_plans))):
+            self.floats.append(self.rodata_vram + len(self.rodata))
+            self.rodata += struct.pack(">f", rng.choice(FLOATS))
+
+        self.rodata += b"\0" * (align(len(self.rodata), 8) - len(self.rodata))
+        for _ in range(max(1, len(self.file_plans) // 2)):
+            self.doubles.append(self.rodata_vram + len(self.rodata))
+            self.rodata += struct.pack(">d", rng.choice(DOUBLES))
+
+        for _ in range(max(1, len(self.file_plans) // 2)):
+            s = rng.choice(STRINGS).encode("ascii") + b"\0"
+            self.strings.append(self.rodata_vram + len(self.rodata))
+            self.rodata += s + b"\0" * (align(len(s), 4) - len(s))
+
+        self.rodata += b"\0" * (align(len(self.rodata), 16) - len(self.rodata))
+
+    def assemble(self) -> Tuple[bytes, List[Tuple[int, int]], List[int]]:
+        """Returns the code bytes, the function (vram, size) list and the code file offsets"""
+        rng = self.rng
+        words: List[int] = []
+        funcs: List[Tuple[int, int]] = []
+        file_offsets: List[int] = []
+        jtbl_iter = iter(self.jtbls)
+
+        # All function addresses are known up front, so calls can go forwards too
+        func_addrs = []
+        addr = self.vram
+        for file_plan in self.file_plans:
+            for plan in file_plan:
+                func_addrs.append(addr)
+                addr += sum(self.block_len(b, plan) for b in plan)
+
+        for file_plan in self.file_plans:
+            file_offsets.append(len(words) * 4)
+            for plan in file_plan:
+                func_start = self.vram + len(words) * 4
+                for block in plan:
+                    pc = self.vram + len(words) * 4
+                    if block == "prologue":
+                        words += [op_i(9, SP, SP, -0x18), op_i(43, SP, RA, 0x14)]
+                    elif block == "epilogue":
+                        words += [
+                            op_i(35, SP, RA, 0x14),
+                            op_r(RA, 0, 0, 0, 8),
+                            op_i(9, SP, SP, 0x18),
+                        ]
+                    elif block == "addr":
+                        target = rng.choice(
+                            self.strings + [s for s, _ in self.data_syms]
+                        )
+                        words += [
+                            op_i(15, 0, A0, hi(target)),
+                            op_i(9, A0, A0, lo(target)),
+                        ]
+                    elif block == "load":
+                        target = rng.choice(self.data_syms)[0]
+                        words += [
+                            op_i(15, 0, T6, hi(target)),
+                            op_i(35, T6, T7, lo(target)),
+                        ]
+                    elif block == "store":
+                        target = rng.choice(self.data_syms)[0]
+                        words += [
+                            op_i(15, 0, AT, hi(target)),
+                            op_i(43, AT, A0, lo(target)),
+                        ]
+                    elif block == "call":
+                        pool = func_addrs
+                        if self.ext_funcs and rng.random() < 0.3:
+                            pool = self.ext_funcs
+                        words += [op_j(3, rng.choice(pool)), 0]
+                    elif block == "loop":
+                        words += [
+                            op_i(9, A0, A0, -1),
+                            op_i(5, A0, ZERO, -2),
+                            0,
+                        ]
+                    elif block == "float":
+                        target = rng.choice(self.floats)
+                        words += [
+                            op_i(15, 0, AT, hi(target)),
+                            op_i(49, AT, 4, lo(target)),
+                        ]
+                    elif block == "double":
+                        target = rng.choice(self.doubles)
+                        words += [
+                            op_i(15, 0, AT, hi(target)),
+                            op_i(53, AT, 6, lo(target)),
+                        ]
+                    elif block == "gp":
+                        words += [op_i(35, GP, V0, rng.randrange(-0x100, 0x100, 4))]
+                    elif block == "switch":
+                        jtbl = next(jtbl_iter)
+                        cases = []
+                        default = pc + (8 + 3 * 5) * 4
+                        end = default + 4
+                        words += [
+                            op_i(11, A0, AT, 5),
+                            op_i(4, AT, ZERO, (default - (pc + 8)) // 4),
+                            op_r(0, A0, T6, 2, 0),
+                            op_i(15, 0, AT, hi(jtbl)),
+                            op_r(AT, T6, AT, 0, 0x21),
+                            op_i(35, AT, T6, lo(jtbl)),
+                            op_r(T6, 0, 0, 0, 8),
+                            0,
+                        ]
+                        for i in range(5):
+                            case_pc = self.vram + len(words) * 4
+                            cases.append(case_pc)
+                            words += [
+                                op_i(9, ZERO, V0, i),
+                                op_i(4, ZERO, ZERO, (end - (case_pc + 8)) // 4),
+                                0,
+                            ]
+                        words += [op_i(9, ZERO, V0, -1)]
+
+                        off = jtbl - self.rodata_vram
+                        self.rodata[off : off + 20] = struct.pack(">5I", *cases)
+                funcs.append((func_start, self.vram + len(words) * 4 - func_start))
+
+        code = b"".join(struct.pack(">I", w) for w in words)
+        assert len(code) == self.code_size
+        return code, funcs, file_offsets
+
+
+def yay0_compress(data: bytes) -> bytes:
+    """Simple greedy Yay0 compressor"""
+    masks: List[int] = []
+    links = bytearray()
+    chunks = bytearray()
+    last_seen: Dict[bytes, int] = {}
+
+    mask = 0
+    mask_bits = 0
+
+    def push_bit(bit):
+        nonlocal mask, mask_bits
+        mask = (mask << 1) | bit
+        mask_bits += 1
+        if mask_bits == 32:
+            masks.append(mask)
+            mask = 0
+            mask_bits = 0
+
+    i = 0
+    while i < len(data):
+        key = data[i : i + 3]
+        cand = last_seen.get(key)
+        length = 0
+        if cand is not None and len(key) == 3 and i - cand <= 0x1000:
+            while (
+                i + length < len(data)
+                and length < 0xFF + 18
+                and data[cand + length] == data[i + length]
+            ):
+                length += 1
+
+        if cand is not None and length >= 3:
+            dist = i - cand - 1
+            if length <= 17:
+                links += struct.pack(">H", ((length - 2) << 12) | dist)
+            else:
+                links += struct.pack(">H", dist)
+                chunks.append(length - 18)
+            push_bit(0)
+            for j in range(i, i + length):
+                last_seen[data[j : j + 3]] = j
+            i += length
+        else:
+            chunks.append(data[i])
+            push_bit(1)
+            last_seen[key] = i
+            i += 1
+
+    if mask_bits:
+        masks.append(mask << (32 - mask_bits))
+
+    mask_bytes = b"".join(struct.pack(">I", m) for m in masks)
+    link_off = 16 + len(mask_bytes)
+    chunk_off = link_off + len(links)
+    header = b"Yay0" + struct.pack(">III", len(data), link_off, chunk_off)
+    return header + mask_bytes + bytes(links) + bytes(chunks)
+
+
+def generate(
+    out_dir: Path,
+    seed: int = 0,
+    code_files: int = 8,
+    funcs_per_file: int = 8,
+    overlays: int = 2,
+    yay0_blobs: int = 2,
+    yay0_size: int = 0x4000,
+    textures: int = 4,
+    texture_size: int = 32,
+) -> Path:
+    """Writes a ROM, config and symbol_addrs.txt to out_dir and returns the config path"""
+    rng = random.Random(seed)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    rom = bytearray(BOOT_END)
+    rom[0:4] = b"\x80\x37\x12\x40"
+    rom[0x8:0xC] = struct.pack(">I", MAIN_VRAM)
+    rom[0x20:0x34] = b"SYNTHETIC SPLAT ROM "
+    rom[0x3B:0x40] = b"NSYE\x00"
+    for i in range(HEADER_SIZE, BOOT_END, 4):
+        rom[i : i + 4] = struct.pack(">I", rng.getrandbits(32))
+
+    segments: List[str] = [
+        "  - name: header\n    type: header\n    start: 0x0\n",
+        "  - name: boot\n    type: bin\n    start: 0x40\n",
+    ]
+    symbol_lines: List[str] = []
+
+    def add_code_group(group: CodeGroup, overlay: bool, file_types: List[str]):
+        code, funcs, file_offsets = group.assemble()
+        rom_start = len(rom)
+        rom.extend(code + group.data + group.rodata)
+
+        seg = f"  - name: {group.name}\n    type: code\n    start: 0x{rom_start:X}\n    vram: 0x{group.vram:X}\n"
+        if overlay:
+            seg += "    overlay: True\n"
+        seg += "    subsegments:\n"
+        for i, off in enumerate(file_offsets):
+            seg += (
+                f"      - [0x{rom_start + off:X}, {file_types[i]}, {group.name}_{i}]\n"
+            )
+        seg += f"      - [0x{rom_start + len(code):X}, data]\n"
+        seg += f"      - [0x{rom_start + len(code) + len(group.data):X}, rodata]\n"
+        segments.append(seg)
+
+        for vram, size in funcs:
+            if rng.random() < 0.3:
+                line = f"{group.name}_func_{vram:X} = 0x{vram:X}; // type:func size:0x{size:X}"
+                if overlay:
+                    line += f" rom:0x{rom_start + vram - group.vram:X}"
+                symbol_lines.append(line)
+        for vram, size in group.data_syms:
+            if rng.random() < 0.2 and size > 4:
+                symbol_lines.append(
+                    f"{group.name}_data_{vram:X} = 0x{vram:X}; // size:0x{size:X}"
+                )
+        return funcs
+
+    num_files = code_files
+    main = CodeGroup(rng, "main", MAIN_VRAM, num_files, funcs_per_file, [])
+    main_types = [rng.choice(["c", "asm"]) for _ in range(num_files)]
+    main_funcs = add_code_group(main, False, main_types)
+
+    # Small data addressed through $gp
+    symbol_lines.append(f"gp_area = 0x{GP_VALUE - 0x100:X}; // size:0x200")
+
+    for n in range(overlays):
+        if len(rom) % 16:
+            rom.extend(b"\0" * (16 - len(rom) % 16))
+        ovl = CodeGroup(
+            rng,
+            f"ovl{n}",
+            OVERLAY_VRAM,
+            max(1, num_files // 4),
+            funcs_per_file,
+            [f for f, _ in main_funcs],
+        )
+        add_code_group(ovl, True, ["asm"] * max(1, num_files // 4))
+
+    for n in range(yay0_blobs):
+        blob = bytearray()
+        while len(blob) < yay0_size:
+            if rng.random() < 0.5:
+                blob += bytes(rng.getrandbits(8) for _ in range(16))
+            else:
+                blob += rng.choice(STRINGS).encode("ascii") * 2
+        compressed = yay0_compress(bytes(blob[:yay0_size]))
+        start = len(rom)
+        rom.extend(compressed)
+        rom.extend(b"\0" * (align(len(rom), 16) - len(rom)))
+        segments.append(f"  - [0x{start:X}, Yay0, blob_{n}]\n")
+
+    w = h = texture_size
+    for n in range(textures):
+        kind = list(TEXTURE_FORMATS)[n % len(TEXTURE_FORMATS)]
+        bpp = TEXTURE_FORMATS[kind]
+        start = len(rom)
+        rom.extend(bytes(rng.getrandbits(8) for _ in range(int(w * h * bpp))))
+        segments.append(f"  - [0x{start:X}, {kind}, tex_{n}, {w}, {h}]\n")
+        if kind in PALETTE_SIZES:
+            start = len(rom)
+            rom.extend(bytes(rng.getrandbits(8) for _ in range(PALETTE_SIZES[kind])))
+            segments.append(f"  - [0x{start:X}, palette, tex_{n}]\n")
+
+    rom.extend(b"\0" * (align(len(rom), 16) - len(rom)))
+    segments.append(f"  - [0x{len(rom):X}]\n")
+
+    (out_dir / "synthetic.z64").write_bytes(rom)
+    (out_dir / "symbol_addrs.txt").write_text("\n".join(symbol_lines) + "\n")
+
+    config = f"""\
+name: Synthetic
+options:
+  basename: synthetic
+  target_path: synthetic.z64
+  base_path: .
+  compiler: GCC
+  find_file_boundaries: False
+  gp_value: 0x{GP_VALUE:X}
+  symbol_addrs_path: symbol_addrs.txt
+  ld_script_path: synthetic.ld
+segments:
+{"".join(segments)}"""
+    config_path = out_dir / "synthetic.yaml"
+    config_path.write_text(config)
+    return config_path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate a synthetic ROM and splat config"
+    )
+    parser.add_argument("out_dir", help="directory to write the ROM and config to")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--code-files", type=int, default=8)
+    parser.add_argument("--funcs-per-file", type=int, default=8)
+    parser.add_argument("--overlays", type=int, default=2)
+    parser.add_argument("--yay0-blobs", type=int, default=2)
+    parser.add_argument("--yay0-size", type=int, default=0x4000)
+    parser.add_argument("--textures", type=int, default=4)
+    parser.add_argument("--texture-size", type=int, default=32)
+
+    args = parser.parse_args()
+    generate(
+        Path(args.out_dir),
+        args.seed,
+        args.code_files,
+        args.funcs_per_file,
+        args.overlays,
+        args.yay0_blobs,
+        args.yay0_size,
+        args.textures,
+        args.texture_size,
+    )